@@ -12,8 +12,30 @@ please see
 Note: this file is for support purposes only, and is not part of your
 submission.
 """
-from algorithms import PushyPassenger, RandomAlgorithm, ShortSighted, RandomArrivals, FileArrivals
+import gzip
+import json
+import pickle
+import random
+import time
+
+import pytest
+
+from algorithms import PushyPassenger, RandomAlgorithm, ShortSighted, RandomArrivals, FileArrivals, \
+    PoissonArrivals, TrafficPattern, record_arrivals, Direction
+from array_engine import FloorQueues
+from benchmark import find_regressions, run_case
+from eventlog import EventLogReplay, EventLogWriter
+from entities import (Elevator, Person, RoundClock, WaitingFloors,
+                      WaitingQueue)
+from experiments import (DEFAULT_SPEC, compare, make_config, replica_seed,
+                         replica_specs, replicate, run_spec, run_sweep,
+                         t_quantile)
+from headless import HeadlessVisualizer
+from renderer import BackgroundVisualizer
+from metrics import WaitTimeHistogram
 from simulation import Simulation
+from timing import STAGES, JSONReportObserver, StageTimer
+from traces import BinaryArrivals, convert_csv, record_trace
 
 
 def test_random_arrival_generator_zero() -> None:
@@ -47,6 +69,122 @@ def test_random_arrival_generator_zero() -> None:
             assert p.start != p.target
 
 
+def test_random_arrivals_are_uniform_and_reproducible() -> None:
+    """Test that random arrivals cover every (start, target) pair with
+    start != target about equally often, and are reproducible by seeding
+    the random module.
+    """
+    pytest.importorskip('numpy')
+    random.seed(18)
+    generator = RandomArrivals(4, 50)
+    counts = {}
+    for round_num in range(240):
+        starts, targets = generator.generate_floors(round_num)
+        assert len(starts) == 50
+        for pair in zip(starts.tolist(), targets.tolist()):
+            counts[pair] = counts.get(pair, 0) + 1
+    assert set(counts) == {(start, target) for start in range(1, 5)
+                           for target in range(1, 5) if start != target}
+    # Each of the 12 pairs is expected 1000 times.
+    assert all(900 < count < 1100 for count in counts.values())
+
+    random.seed(18)
+    first = RandomArrivals(4, 50).generate(0)
+    random.seed(18)
+    again = RandomArrivals(4, 50).generate(0)
+    assert {floor: [p.target for p in people]
+            for floor, people in first.items()} == \
+        {floor: [p.target for p in people] for floor, people in again.items()}
+
+
+def test_random_arrivals_pickle_without_their_block() -> None:
+    """Test that a pickled RandomArrivals keeps only its seed and position,
+    and continues with the same arrivals, also across blocks.
+    """
+    pytest.importorskip('numpy')
+    for num_people in [3, 40000]:
+        random.seed(18)
+        generator = RandomArrivals(9, num_people)
+        for round_num in range(5):
+            generator.generate_floors(round_num)
+        data = pickle.dumps(generator)
+        assert len(data) < 500
+        copy = pickle.loads(data)
+        for round_num in range(5, 10):
+            expected = generator.generate_floors(round_num)
+            actual = copy.generate_floors(round_num)
+            assert expected[0].tolist() == actual[0].tolist()
+            assert expected[1].tolist() == actual[1].tolist()
+
+
+def test_poisson_arrivals_follow_profile() -> None:
+    """Test that Poisson arrivals follow the rate and floor weights of the
+    traffic pattern in effect, and do not depend on which rounds were
+    generated before.
+    """
+    pytest.importorskip('numpy')
+    profile = [TrafficPattern(0, 4.0, [1, 0, 0, 0, 0], [0, 0, 1, 1, 0]),
+               TrafficPattern(100, 0.0),
+               TrafficPattern(150, 2.0)]
+    random.seed(19)
+    generator = PoissonArrivals(5, profile, period=200)
+    morning = [generator.generate_floors(r) for r in range(100)]
+    assert 300 < sum(len(starts) for starts, _ in morning) < 500
+    for starts, targets in morning:
+        assert set(starts.tolist()) <= {1}
+        assert set(targets.tolist()) <= {3, 4}
+    assert all(generator.generate(r) == {} for r in range(100, 150))
+    assert 150 <= generator.next_arrival_round(100) < 200
+
+    for starts, targets in [generator.generate_floors(r)
+                            for r in range(150, 200)]:
+        assert (starts != targets).all()
+
+    random.seed(19)
+    again = PoissonArrivals(5, profile, period=200)
+    assert again.generate_floors(450)[1].tolist() == \
+        generator.generate_floors(450)[1].tolist()
+    assert again.generate_floors(7)[0].tolist() == morning[7][0].tolist()
+
+    with pytest.raises(ValueError):
+        PoissonArrivals(3, [TrafficPattern(0, 1.0, [1, 0, 0], [1, 0, 0])])
+
+
+def test_poisson_arrivals_sample_each_block_once(monkeypatch) -> None:
+    """Test that an event-driven run over many days of Poisson arrivals
+    samples each block of rounds at most once, with the same statistics as
+    the object engine.
+    """
+    pytest.importorskip('numpy')
+    import algorithms
+    from algorithms import office_day
+    monkeypatch.setattr(algorithms, '_BLOCK_ROUNDS', 50)
+    day = 480
+    results = []
+    for engine in ['object', 'event']:
+        random.seed(19)
+        generator = PoissonArrivals(6, office_day(6, 0.5, day), period=day)
+        blocks = []
+        sample_block = generator._sample_block
+        monkeypatch.setattr(generator, '_sample_block',
+                            lambda block: (blocks.append(block),
+                                           sample_block(block)))
+        config = {
+            'num_floors': 6,
+            'num_elevators': 2,
+            'elevator_capacity': 4,
+            'num_people_per_round': 1,
+            'arrival_generator': generator,
+            'moving_algorithm': ShortSighted(),
+            'visualize': False,
+            'engine': engine
+        }
+        results.append(Simulation(config).run(5 * day))
+        assert 0 < len(blocks) <= 5 * day // 50
+        assert blocks == sorted(set(blocks))
+    assert results[0] == results[1]
+
+
 def test_file_arrival_generator() -> None:
     """Test the CSV arrival generator for the given sample_arrivals file.
     """
@@ -84,6 +222,365 @@ def test_file_arrival_generator() -> None:
             assert len(people) == 0
 
 
+def test_file_arrival_generator_gzip(tmp_path) -> None:
+    """Test that a gzip-compressed trace gives the same arrivals as the
+    plain CSV file, even when rounds are requested out of order.
+    """
+    compressed = tmp_path / 'sample_arrivals.csv.gz'
+    with open('sample_arrivals.csv', 'rb') as plain, \
+            gzip.open(compressed, 'wb') as packed:
+        packed.write(plain.read())
+
+    plain_generator = FileArrivals(5, 'sample_arrivals.csv')
+    gzip_generator = FileArrivals(5, str(compressed))
+    for round_num in [0, 1, 3, 5, 1, 6]:
+        expected = plain_generator.generate(round_num)
+        actual = gzip_generator.generate(round_num)
+        assert expected.keys() == actual.keys()
+        for floor, people in expected.items():
+            assert [(p.start, p.target) for p in people] == \
+                [(p.start, p.target) for p in actual[floor]]
+
+
+def test_file_arrival_generator_rejects_unsorted_rounds(tmp_path) -> None:
+    """Test that a trace whose rounds go backwards raises ValueError, naming
+    the offending line, instead of silently skipping it.
+    """
+    path = tmp_path / 'unsorted.csv'
+    path.write_text('0, 1, 2\n3, 2, 1\n2, 1, 3\n')
+    generator = FileArrivals(3, str(path))
+    assert list(generator.generate(0)) == [1]
+    with pytest.raises(ValueError, match='line 3'):
+        generator.generate(3)
+
+
+def test_binary_trace_matches_csv(tmp_path) -> None:
+    """Test that a CSV trace converted to the binary format, and a trace
+    recorded from a generator, give back the same arrivals.
+    """
+    pytest.importorskip('numpy')
+    path = str(tmp_path / 'sample.trace')
+    convert_csv('sample_arrivals.csv', path, 5)
+    binary = BinaryArrivals(5, path)
+    plain = FileArrivals(5, 'sample_arrivals.csv')
+    for round_num in [0, 1, 3, 5, 9, 1]:
+        expected = plain.generate(round_num)
+        actual = binary.generate(round_num)
+        assert expected.keys() == actual.keys()
+        for floor, people in expected.items():
+            assert [(p.start, p.target) for p in people] == \
+                [(p.start, p.target) for p in actual[floor]]
+    assert binary.next_arrival_round(2) == 3
+    assert binary.next_arrival_round(6) is None
+
+    recorded = str(tmp_path / 'recorded.trace')
+    record_trace(FileArrivals(5, 'sample_arrivals.csv'), 10, recorded)
+    with open(path, 'rb') as converted, open(recorded, 'rb') as copy:
+        assert converted.read() == copy.read()
+
+
+def test_person_wait_time_follows_clock() -> None:
+    """Test that a person's wait time is derived from the simulation clock
+    while they wait, and frozen once they stop waiting.
+    """
+    clock = RoundClock()
+    clock.round_num = 4
+    person = Person(1, 3, 0)
+    person.start_waiting(clock)
+    assert person.arrival_round == 4
+    assert person.wait_time == 0
+
+    clock.round_num += 7
+    assert person.wait_time == 7
+    assert person.get_anger_level() == 3
+
+    person.stop_waiting()
+    clock.round_num += 5
+    assert person.wait_time == 7
+
+
+def test_waiting_queue_boards_from_front() -> None:
+    """Test that a waiting queue boards people in arrival order, up to the
+    requested count.
+    """
+    people = [Person(2, target, 0) for target in [1, 3, 4, 5]]
+    queue = WaitingQueue(people[:3])
+    queue.extend(people[3:])
+    assert len(queue) == 4
+
+    assert queue.board(3) == people[:3]
+    assert list(queue) == people[3:]
+    assert queue[0] is people[3]
+    assert queue.board(5) == people[3:]
+    assert len(queue) == 0
+
+
+def test_waiting_floors_index() -> None:
+    """Test the occupied-floor queries of the simulation's waiting people.
+    """
+    waiting = WaitingFloors()
+    waiting.add(6, [Person(6, 1, 0)])
+    waiting.add(2, [Person(2, 5, 0), Person(2, 3, 0)])
+    waiting.add(4, [])
+    assert list(waiting) == [6, 2]
+    assert waiting.lowest_floor() == 2
+    assert waiting.highest_floor() == 6
+    # Floors 2 and 6 are both two floors away from floor 4; people have been
+    # waiting on floor 6 for longer.
+    assert waiting.nearest_floor(4) == 6
+    assert waiting.nearest_floor(3) == 2
+
+    assert len(waiting.board(6, 3)) == 1
+    assert 6 not in waiting
+    assert waiting.nearest_floor(9) == 2
+    assert len(waiting.board(2, 1)) == 1
+    assert len(waiting[2]) == 1
+
+
+def test_elevator_indexes_passengers_by_target() -> None:
+    """Test that an elevator unloads a whole target floor at once, and finds
+    the nearest target floor, breaking ties by boarding order.
+    """
+    elevator = Elevator([], 9, 5)
+    elevator.curFloor = 5
+    people = [Person(5, target, 0) for target in [7, 3, 7, 8]]
+    for person in people:
+        elevator.boarding(person)
+
+    assert elevator.first_passenger() is people[0]
+    # Floors 3 and 7 are both two floors away; floor 7's passenger boarded
+    # first.
+    assert elevator.nearest_target(5) == 7
+
+    assert elevator.disembark_at(7) == [people[0], people[2]]
+    assert elevator.passenNum == 2
+    assert elevator.passengers == (people[1], people[3])
+    with pytest.raises(AttributeError):
+        elevator.passengers.append(people[0])
+    assert elevator.first_passenger() is people[1]
+    assert elevator.nearest_target(5) == 3
+    assert elevator.disembark_at(7) == []
+
+
+def test_headless_simulation_creates_no_sprites() -> None:
+    """Test that a simulation that is not visualized never creates sprites.
+    """
+    config = {
+        'num_floors': 5,
+        'num_elevators': 2,
+        'elevator_capacity': 1,
+        'num_people_per_round': 2,
+        'arrival_generator': FileArrivals(5, 'sample_arrivals.csv'),
+        'moving_algorithm': PushyPassenger(),
+        'visualize': False
+    }
+    sim = Simulation(config)
+    sim.run(3)
+
+    assert isinstance(sim.visualizer, HeadlessVisualizer)
+    for elevator in sim.elevators:
+        assert elevator.sprite is None
+        for passenger in elevator.passengers:
+            assert passenger.sprite is None
+
+
+def test_person_images_are_shared_and_refreshed(monkeypatch) -> None:
+    """Test that each person image is loaded and scaled only once, and that
+    a person's sprite only swaps its image when their anger level changes.
+    """
+    pygame = pytest.importorskip('pygame')
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    import sprites
+    loaded = []
+
+    def load(path: str):
+        loaded.append(path)
+        return pygame.Surface((10, 10))
+
+    monkeypatch.setattr(sprites, '_FIGURE_CACHE', {})
+    monkeypatch.setattr(pygame.image, 'load', load)
+
+    clock = RoundClock()
+    people = [Person(1, 2, 0) for _ in range(5)]
+    for person in people:
+        person.start_waiting(clock)
+    figures = [sprites.BoundPersonSprite(person) for person in people]
+    assert loaded == [sprites.FIGURES[0]]
+    assert len({id(sprite.image) for sprite in figures}) == 1
+
+    clock.round_num = 1
+    assert not any(sprite.refresh_image() for sprite in figures)
+    clock.round_num = 3
+    assert all(sprite.refresh_image() for sprite in figures)
+    assert all(sprite.anger_level == 1 for sprite in figures)
+    assert loaded == [sprites.FIGURES[0], sprites.FIGURES[1]]
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_visualizer_batches_transfers(monkeypatch, batch) -> None:
+    """Test that the boardings and disembarkings of a round are animated
+    together in a fixed number of frames, unless batching is turned off.
+    """
+    pygame = pytest.importorskip('pygame')
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    import sprites
+    import visualizer
+    monkeypatch.setattr(sprites, 'load_figure',
+                        lambda level, width, height: pygame.Surface(
+                            (width, height)))
+    frames = []
+    monkeypatch.setattr(visualizer.Visualizer, 'render',
+                        lambda self: frames.append(1))
+
+    elevator = Elevator([], 3, 10)
+    vis = visualizer.Visualizer([elevator], 3, True, batch_transfers=batch)
+    people = [Person(1, 2, 0) for _ in range(8)]
+    vis.show_arrivals({1: people})
+    frames.clear()
+    for person in people:
+        elevator.boarding(person)
+        vis.show_boarding(person, elevator)
+    vis.wait(0)
+    expected = visualizer.TRANSFER_FRAMES + 1
+    assert len(frames) == (expected if batch else expected * len(people))
+    assert all(person.sprite.rect.centerx > 10 for person in people)
+
+
+def test_dirty_rendering_matches_full_redraw(monkeypatch) -> None:
+    """Test that drawing only the dirty sprites leaves the screen exactly as
+    redrawing everything would, and that people who disembarked are removed
+    once they have walked off.
+    """
+    pygame = pytest.importorskip('pygame')
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    import sprites
+    import visualizer
+
+    def load_figure(level, width, height):
+        image = pygame.Surface((width, height))
+        image.fill(sprites.ANGER_COLOURS[level])
+        return image
+
+    monkeypatch.setattr(sprites, 'load_figure', load_figure)
+    monkeypatch.setattr(visualizer, 'FPS', 0)
+    monkeypatch.setattr(visualizer.Visualizer, 'wait',
+                        lambda self, wait_time: self.flush_transfers())
+    frames = []
+    render = visualizer.Visualizer.render
+
+    def render_and_compare(self) -> None:
+        render(self)
+        full = self._background.copy()
+        for sprite in self._sprite_group:
+            full.blit(sprite.image, sprite.rect)
+        assert pygame.image.tostring(self._screen, 'RGB') == \
+            pygame.image.tostring(full, 'RGB')
+        frames.append(1)
+
+    monkeypatch.setattr(visualizer.Visualizer, 'render', render_and_compare)
+
+    random.seed(24)
+    sim = Simulation({
+        'num_floors': 4,
+        'num_elevators': 2,
+        'elevator_capacity': 3,
+        'num_people_per_round': 2,
+        'arrival_generator': RandomArrivals(4, 2),
+        'moving_algorithm': ShortSighted(),
+        'visualize': True
+    })
+    vis = sim.visualizer
+    for _ in range(8):
+        sim.run(1)
+        present = {person.sprite for people in sim.waiting.values()
+                   for person in people}
+        for elevator in sim.elevators:
+            present.update(person.sprite for person in elevator.passengers)
+        assert set(vis._person_group) == present
+    assert sim.statistics['people_completed'] > 0
+    assert len(frames) > 8 * visualizer.TRANSFER_FRAMES
+
+
+def test_viewport_visualizer_culls_and_groups_crowds(monkeypatch) -> None:
+    """Test that a viewport visualizer only draws the people waiting on the
+    floors in view, and draws a crowd instead of the people on a floor where
+    too many wait.
+    """
+    pygame = pytest.importorskip('pygame')
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    import sprites
+    import visualizer
+    monkeypatch.setattr(sprites, 'load_figure',
+                        lambda level, width, height: pygame.Surface(
+                            (width, height)))
+
+    def crowds() -> list:
+        return sorted(sprite.size for sprite in vis._sprite_group
+                      if isinstance(sprite, sprites.CrowdSprite))
+
+    elevator = Elevator([], 30, 10)
+    vis = visualizer.ViewportVisualizer([elevator], 30, True, view_floors=5,
+                                        crowd_threshold=3)
+    assert pygame.display.get_surface().get_height() == \
+        5 * visualizer.FLOOR_HEIGHT + visualizer.STAT_WINDOW_HEIGHT
+    lobby = [Person(1, 9, 0) for _ in range(10)]
+    second = [Person(2, 3, 0) for _ in range(2)]
+    high = [Person(20, 1, 0) for _ in range(4)]
+    vis.show_arrivals({1: lobby, 2: second, 20: high})
+    assert crowds() == [10]
+    assert not any(person.sprite and person.sprite.alive()
+                   for person in lobby + high)
+    assert all(person.sprite.alive() for person in second)
+
+    vis.scroll(100)
+    vis.scroll(-8)
+    assert crowds() == [4]
+    assert not any(person.sprite.alive() for person in second)
+
+    vis.scroll(-100)
+    for person in lobby[:7]:
+        elevator.boarding(person)
+        vis.show_boarding(person, elevator)
+    vis.flush_transfers()
+    assert crowds() == []
+    assert all(person.sprite.alive() for person in lobby)
+
+    # A state shown part way through replaces the people waiting so far.
+    rider = Person(4, 2, 0)
+    elevator.boarding(rider)
+    elevator.curFloor = 4
+    waiting = WaitingFloors({3: [Person(3, 1, 0) for _ in range(5)],
+                             12: [Person(12, 1, 0)]})
+    vis.show_state([elevator], waiting)
+    assert crowds() == [5]
+    assert not any(person.sprite.alive() for person in lobby[7:] + second)
+    assert rider.sprite.alive()
+    person = waiting.board(3, 1)[0]
+    elevator.boarding(person)
+    vis.show_boarding(person, elevator)
+    vis.flush_transfers()
+    assert crowds() == [4]
+
+
+def test_wait_time_histogram_percentiles() -> None:
+    """Test the streaming wait time histogram: exact for short waits, and
+    within its precision for long ones.
+    """
+    histogram = WaitTimeHistogram(precision_bits=4)
+    assert histogram.percentile(50) == -1
+    for wait_time in range(1, 101):
+        histogram.record(wait_time)
+    histogram.record(1000, count=5)
+
+    assert histogram.total_count == 105
+    assert histogram.percentile(10) == 11
+    # 95 lands in the bucket [88, 95]; 1000 in [960, 1023], capped at 1000.
+    assert histogram.percentile(90) == 95
+    assert histogram.percentile(99) == 1000
+    assert histogram.buckets()[-1] == (960, 1023, 5)
+    assert sum(count for _, _, count in histogram.buckets()) == 105
+
+
 def test_random_moving_algorithm() -> None:
     """Test the random moving algorithm.
 
@@ -165,6 +662,8 @@ def test_pushy_passenger_moving_algorithm() -> None:
     assert results['max_time'] == 3
     assert results['min_time'] == 3
     assert results['avg_time'] == 3
+    assert results['p50_time'] == results['p99_time'] == 3
+    assert results['wait_histogram'] == [(3, 3, 3)]
 
 
 def test_short_sighted_moving_algorithm() -> None:
@@ -198,6 +697,618 @@ def test_short_sighted_moving_algorithm() -> None:
     assert results['avg_time'] == 4
 
 
+
+def test_numpy_engine_matches_object_engine(tmp_path) -> None:
+    """Test that the numpy engine reports the same statistics as the object
+    engine, on a busy random trace and with several people per elevator.
+    """
+    pytest.importorskip('numpy')
+    rng = random.Random(148)
+    trace = tmp_path / 'busy.csv'
+    with open(trace, 'w') as f:
+        for round_num in range(40):
+            line = [round_num]
+            for _ in range(rng.randint(0, 6)):
+                start, target = rng.sample(range(1, 9), 2)
+                line.extend([start, target])
+            f.write(', '.join(str(value) for value in line) + '\n')
+
+    for algorithm in [PushyPassenger, ShortSighted]:
+        results = []
+        for engine in ['object', 'numpy']:
+            config = {
+                'num_floors': 8,
+                'num_elevators': 3,
+                'elevator_capacity': 4,
+                'num_people_per_round': 2,
+                'arrival_generator': FileArrivals(8, str(trace)),
+                'moving_algorithm': algorithm(),
+                'visualize': False,
+                'engine': engine
+            }
+            results.append(Simulation(config).run(40))
+        assert results[0] == results[1]
+
+
+def test_floor_queues_keep_arrival_order_as_they_grow() -> None:
+    """Test that FloorQueues keep each floor's people in order of arrival
+    while their rings wrap around and move to bigger rings.
+    """
+    pytest.importorskip('numpy')
+    import numpy as np
+    rng = random.Random(4)
+    queues = FloorQueues(3)
+    expected = {floor: [] for floor in range(4)}
+    for round_num in range(300):
+        starts = sorted(rng.choices(range(1, 4), k=rng.randint(0, 12)))
+        targets = [rng.randint(1, 3) for _ in starts]
+        queues.push(np.array(starts, dtype=np.int64),
+                    np.array(targets, dtype=np.int64),
+                    np.bincount(starts, minlength=4), round_num)
+        for start, target in zip(starts, targets):
+            expected[start].append((target, round_num))
+
+        taken = [0] + [rng.randint(0, len(expected[floor]) // 8)
+                       for floor in range(1, 4)]
+        floors, got_targets, got_arrivals = queues.contents()
+        assert list(zip(floors.tolist(), got_targets.tolist(),
+                        got_arrivals.tolist())) == \
+            [(floor, target, arrival) for floor in range(4)
+             for target, arrival in expected[floor]]
+        floors = np.arange(1, 4)
+        got = queues.peek(floors, np.zeros(3, dtype=np.int64),
+                          np.array(taken[1:]))
+        assert list(zip(*(values.tolist() for values in got))) == \
+            [pair for floor in range(1, 4)
+             for pair in expected[floor][:taken[floor]]]
+        queues.pop(np.array(taken))
+        for floor in range(1, 4):
+            del expected[floor][:taken[floor]]
+        assert queues.lengths().tolist() == \
+            [len(expected[floor]) for floor in range(4)]
+
+
+def test_engines_continue_a_second_run(tmp_path) -> None:
+    """Test that running a simulation twice continues from the round the
+    first run stopped at, with the same statistics on every engine as one
+    run of both lengths.
+    """
+    pytest.importorskip('numpy')
+    rng = random.Random(16)
+    trace = tmp_path / 'busy.csv'
+    with open(trace, 'w') as f:
+        for round_num in range(50):
+            line = [round_num]
+            for _ in range(rng.randint(0, 4)):
+                line.extend(rng.sample(range(1, 7), 2))
+            f.write(', '.join(str(value) for value in line) + '\n')
+
+    def make_simulation(engine: str) -> Simulation:
+        return Simulation({
+            'num_floors': 6,
+            'num_elevators': 2,
+            'elevator_capacity': 3,
+            'num_people_per_round': 2,
+            'arrival_generator': FileArrivals(6, str(trace)),
+            'moving_algorithm': ShortSighted(),
+            'visualize': False,
+            'engine': engine
+        })
+
+    expected = make_simulation('object').run(50)
+    for engine in ['object', 'numpy', 'event']:
+        sim = make_simulation(engine)
+        sim.run(25)
+        assert sim.run(25) == expected
+
+
+def test_event_engine_matches_object_engine(tmp_path) -> None:
+    """Test that the event-driven engine skips to the next arrival, and
+    reports the same statistics as the object engine on a sparse trace.
+    """
+    rng = random.Random(15)
+    trace = tmp_path / 'sparse.csv'
+    with open(trace, 'w') as f:
+        round_num = 0
+        for _ in range(30):
+            round_num += rng.randint(1, 60)
+            start, target = rng.sample(range(1, 13), 2)
+            f.write(f'{round_num}, {start}, {target}, {target}, {start}\n')
+
+    arrivals = FileArrivals(12, str(trace))
+    first = arrivals.next_arrival_round(0)
+    assert first > 0
+    assert arrivals.generate(first - 1) == {}
+    assert arrivals.next_arrival_round(first) == first
+    assert len(arrivals.generate(first)) == 2
+
+    for algorithm in [PushyPassenger, ShortSighted]:
+        results = []
+        for engine in ['object', 'event']:
+            config = {
+                'num_floors': 12,
+                'num_elevators': 3,
+                'elevator_capacity': 2,
+                'num_people_per_round': 2,
+                'arrival_generator': FileArrivals(12, str(trace)),
+                'moving_algorithm': algorithm(),
+                'visualize': False,
+                'engine': engine
+            }
+            results.append(Simulation(config).run(round_num + 100))
+        assert results[0] == results[1]
+        assert results[0]['people_completed'] == 60
+
+
+def test_snapshot_and_restore() -> None:
+    """Test that a simulation restored from a snapshot continues exactly as
+    the original simulation does, for random and file arrivals.
+    """
+    for generator, algorithm in [
+            (lambda: RandomArrivals(7, 3), RandomAlgorithm),
+            (lambda: FileArrivals(7, 'sample_arrivals.csv'), ShortSighted)]:
+        def make_simulation() -> Simulation:
+            return Simulation({
+                'num_floors': 7,
+                'num_elevators': 2,
+                'elevator_capacity': 2,
+                'num_people_per_round': 3,
+                'arrival_generator': generator(),
+                'moving_algorithm': algorithm(),
+                'visualize': False
+            })
+
+        random.seed(16)
+        original = make_simulation()
+        original.run(4)
+        snapshot = original.snapshot()
+        expected = original.run(20)
+
+        random.seed(99)
+        restored = make_simulation()
+        restored.restore(snapshot)
+        assert restored.run(20) == expected
+        assert expected['num_iterations'] == 24
+
+
+def test_restore_shows_the_restored_state() -> None:
+    """Test that restoring a snapshot shows the restored state to the
+    visualizer, which can then draw the rest of the run, and that a
+    snapshot with another number of elevators is rejected.
+    """
+    def make_simulation(num_elevators: int = 2) -> Simulation:
+        return Simulation({
+            'num_floors': 6,
+            'num_elevators': num_elevators,
+            'elevator_capacity': 2,
+            'num_people_per_round': 3,
+            'arrival_generator': RandomArrivals(6, 3),
+            'moving_algorithm': ShortSighted(),
+            'visualize': False
+        })
+
+    def renderer(frames, num_floors, num_elevators) -> None:
+        while frames.get() is not None:
+            frames.task_done()
+        frames.task_done()
+
+    random.seed(16)
+    original = make_simulation()
+    original.run(5)
+    snapshot = original.snapshot()
+    state = _state(original.elevators, original.waiting)
+    expected = original.run(10)
+
+    restored = make_simulation()
+    restored.visualizer = _EventRecorder()
+    restored.restore(snapshot)
+    assert restored.visualizer.events == [('state', state)]
+    assert state[2]
+
+    restored = make_simulation()
+    restored.visualizer = BackgroundVisualizer(
+        restored.elevators, 6, mode='thread', target=renderer)
+    restored.restore(snapshot)
+    assert restored.run(10) == expected
+    restored.visualizer.close()
+
+    with pytest.raises(ValueError):
+        make_simulation(3).restore(snapshot)
+
+
+def test_round_recorder(tmp_path) -> None:
+    """Test that the per-round recording of the sample run adds up to the
+    run's statistics, across several chunk files.
+    """
+    pytest.importorskip('numpy')
+    from recorder import RoundRecorder, load_recording
+    config = {
+        'num_floors': 5,
+        'num_elevators': 2,
+        'elevator_capacity': 1,
+        'num_people_per_round': 2,
+        'arrival_generator': FileArrivals(5, 'sample_arrivals.csv'),
+        'moving_algorithm': PushyPassenger(),
+        'visualize': False,
+        'recorder': RoundRecorder(str(tmp_path), 5, 2, chunk_rounds=4)
+    }
+    sim = Simulation(config)
+    results = sim.run(10)
+
+    recording = load_recording(str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 3
+    assert list(recording['round']) == list(range(10))
+    assert recording['arrivals'].sum() == results['total_people']
+    assert recording['completions'].sum() == results['people_completed']
+    assert recording['queue_length'].shape == (10, 5)
+    assert list(recording['position'][-1]) == [e.curFloor
+                                               for e in sim.elevators]
+    assert list(recording['load'][-1]) == [e.passenNum for e in sim.elevators]
+
+class _EventRecorder(HeadlessVisualizer):
+    """A visualizer that records what it is shown."""
+    def __init__(self) -> None:
+        self.events = []
+
+    def render_header(self, round_num: int) -> None:
+        self.events.append(('round', round_num))
+
+    def show_arrivals(self, arrivals) -> None:
+        self.events.append(('arrive', [(p.start, p.target, p.wait_time)
+                                       for people in arrivals.values()
+                                       for p in people]))
+
+    def show_boarding(self, person, elevator) -> None:
+        self.events.append(('board', person.target, person.wait_time,
+                            elevator.curFloor, elevator.passenNum))
+
+    def show_disembarking(self, person, elevator) -> None:
+        self.events.append(('leave', person.target, person.wait_time,
+                            elevator.curFloor))
+
+    def show_elevator_moves(self, elevators, directions) -> None:
+        self.events.append(('move', [e.curFloor for e in elevators],
+                            list(directions)))
+
+    def show_state(self, elevators, waiting) -> None:
+        self.events.append(('state', _state(elevators, waiting)))
+
+
+def _state(elevators, waiting) -> tuple:
+    """Return the elevator floors, passengers and waiting people of a
+    simulation, as plain values.
+    """
+    return ([e.curFloor for e in elevators],
+            [[(p.target, p.wait_time) for p in e.passengers]
+             for e in elevators],
+            {floor: [(p.target, p.wait_time) for p in people]
+             for floor, people in waiting.items()})
+
+
+def test_event_log_replay(tmp_path) -> None:
+    """Test that replaying an event log shows the same events as the logged
+    run, and that seeking to a round restores its state from a keyframe.
+    """
+    path = str(tmp_path / 'run.log')
+
+    def make_simulation(event_log=None) -> Simulation:
+        return Simulation({
+            'num_floors': 7,
+            'num_elevators': 3,
+            'elevator_capacity': 2,
+            'num_people_per_round': 3,
+            'arrival_generator': RandomArrivals(7, 3),
+            'moving_algorithm': RandomAlgorithm(),
+            'visualize': False,
+            'event_log': event_log
+        })
+
+    random.seed(21)
+    logged = make_simulation(EventLogWriter(path, keyframe_interval=8))
+    expected_stats = logged.run(30)
+    # Until the log is closed, it has no keyframe index and is scanned.
+    with EventLogReplay(path) as replay:
+        scanned = replay._keyframes
+    logged.visualizer.close()
+    with EventLogReplay(path) as replay:
+        assert replay._keyframes == scanned
+    assert sorted(scanned) == [0, 8, 16, 24]
+
+    random.seed(21)
+    shown = make_simulation()
+    shown.visualizer = _EventRecorder()
+    shown.run(13)
+    state = _state(shown.elevators, shown.waiting)
+    assert shown.run(17) == expected_stats
+    expected = shown.visualizer.events
+
+    with EventLogReplay(path) as replay:
+        assert replay.num_floors == 7 and len(replay.elevators) == 3
+        recorder = _EventRecorder()
+        replay.play(recorder)
+    assert recorder.events[0] == ('state', ([1, 1, 1], [[], [], []], {}))
+    assert recorder.events[1:] == expected
+
+    for start in [13, 16]:
+        recorder = _EventRecorder()
+        with EventLogReplay(path) as replay:
+            replay.play(recorder, start, 20)
+        first = expected.index(('round', start))
+        assert recorder.events[1:] == expected[first:expected.index(
+            ('round', 20))]
+    assert recorder.events[0][0] == 'state'
+    recorder = _EventRecorder()
+    with EventLogReplay(path) as replay:
+        replay.play(recorder, 13, 14)
+    assert recorder.events[0] == ('state', state)
+
+    # A log of a restored simulation starts from the restored state.
+    random.seed(21)
+    original = make_simulation()
+    original.run(13)
+    snapshot = original.snapshot()
+    with EventLogWriter(path, keyframe_interval=8) as writer:
+        restored = make_simulation(writer)
+        restored.restore(snapshot)
+        restored.run(17)
+    recorder = _EventRecorder()
+    with EventLogReplay(path) as replay:
+        replay.play(recorder, 13)
+    assert recorder.events[0] == ('state', state)
+    assert recorder.events[1:] == expected[expected.index(('round', 13)):]
+
+
+def test_event_log_replay_disembarks_one_by_one(tmp_path) -> None:
+    """Test that a replay shows each disembarking while the riders leaving
+    after it are still on board.
+    """
+    path = str(tmp_path / 'run.log')
+    random.seed(21)
+    with EventLogWriter(path) as writer:
+        Simulation({
+            'num_floors': 4,
+            'num_elevators': 1,
+            'elevator_capacity': 6,
+            'num_people_per_round': 3,
+            'arrival_generator': RandomArrivals(4, 3),
+            'moving_algorithm': ShortSighted(),
+            'visualize': False,
+            'event_log': writer
+        }).run(20)
+    staying = []
+
+    class _LeaveRecorder(HeadlessVisualizer):
+        def show_disembarking(self, person, elevator) -> None:
+            assert person not in elevator.passengers
+            staying.append(sum(rider.target == elevator.curFloor
+                               for rider in elevator.passengers))
+
+    with EventLogReplay(path) as replay:
+        replay.play(_LeaveRecorder())
+    assert 2 in staying
+    assert all(staying[i + 1] == count - 1
+               for i, count in enumerate(staying) if count > 0)
+
+
+def test_background_visualizer_drops_frames() -> None:
+    """Test that a simulation drawn by a slow background renderer runs as it
+    does headless, publishing snapshots of its rounds and dropping the oldest
+    frames when the renderer cannot keep up, so the last round is drawn.
+    """
+    drawn = []
+
+    def slow_renderer(frames, num_floors, num_elevators) -> None:
+        while True:
+            frame = frames.get()
+            if frame is not None:
+                time.sleep(0.002)
+                drawn.append(frame)
+            frames.task_done()
+            if frame is None:
+                break
+
+    def make_simulation() -> Simulation:
+        return Simulation({
+            'num_floors': 6,
+            'num_elevators': 2,
+            'elevator_capacity': 3,
+            'num_people_per_round': 2,
+            'arrival_generator': RandomArrivals(6, 2),
+            'moving_algorithm': ShortSighted(),
+            'visualize': False
+        })
+
+    random.seed(22)
+    expected = make_simulation().run(300)
+    random.seed(22)
+    sim = make_simulation()
+    sim.visualizer = BackgroundVisualizer(sim.elevators, 6, mode='thread',
+                                          max_frames=2, target=slow_renderer)
+    assert sim.run(300) == expected
+    sim.visualizer.finish()
+    assert sim.visualizer.frames_published == 300
+    assert sim.visualizer.frames_dropped > 0
+    assert len(drawn) + sim.visualizer.frames_dropped == 300
+    rounds = [frame.round_num for frame in drawn]
+    assert rounds == sorted(set(rounds))
+    assert rounds[-1] == 299
+    assert all(len(frame.floors) == len(frame.riders) == 2
+               and all(1 <= floor <= 6 for floor in frame.floors)
+               for frame in drawn)
+    sim.visualizer.close()
+
+    # A closed renderer is started again for a second run.
+    sim.run(10)
+    sim.visualizer.close()
+    assert drawn[-1].round_num == 309
+
+
+def test_background_visualizer_shows_a_given_state() -> None:
+    """Test that a background visualizer draws the people it is shown part
+    way through a simulation, and lets them board.
+    """
+    drawn = []
+
+    def renderer(frames, num_floors, num_elevators) -> None:
+        while True:
+            frame = frames.get()
+            drawn.append(frame)
+            frames.task_done()
+            if frame is None:
+                break
+
+    elevators = [Elevator([Person(1, 4, 0)], 5, 3), Elevator([], 5, 3)]
+    elevators[1].curFloor = 3
+    waiting = WaitingFloors({3: [Person(3, 1, 0), Person(3, 5, 0)],
+                             2: [Person(2, 5, 0)]})
+    vis = BackgroundVisualizer(elevators, 5, mode='thread', target=renderer)
+    vis.show_state(elevators, waiting)
+    person = waiting.board(3, 1)[0]
+    elevators[1].boarding(person)
+    vis.show_boarding(person, elevators[1])
+    vis.show_elevator_moves(elevators, [Direction.STAY, Direction.STAY])
+    vis.close()
+    frame = drawn[0]
+    assert frame.floors == (1, 3)
+    assert frame.riders == ((0,), (0,))
+    assert frame.waiting == ((2, (0,)), (3, (0,)))
+
+
+def test_parameter_sweep() -> None:
+    """Test that a sweep runs every combination of the grid in parallel, and
+    that seeded runs are reproducible.
+    """
+    grid = {
+        'num_floors': [5, 8],
+        'num_elevators': 2,
+        'moving_algorithm': ['PushyPassenger', 'ShortSighted'],
+        'num_rounds': 20,
+        'seed': 3
+    }
+    rows = run_sweep(grid, processes=2)
+    assert [(row['num_floors'], row['moving_algorithm']) for row in rows] == [
+        (5, 'PushyPassenger'), (5, 'ShortSighted'),
+        (8, 'PushyPassenger'), (8, 'ShortSighted')]
+    for row in rows:
+        assert row['num_iterations'] == 20
+        assert row['total_people'] == 20 * row['num_people_per_round']
+
+    assert run_sweep(grid, processes=1) == rows
+
+
+def test_replications_are_reproducible() -> None:
+    """Test that replicas get distinct, deterministic seeds, that any replica
+    can be rerun alone, and that every statistic is summarized.
+    """
+    spec = {'moving_algorithm': 'RandomAlgorithm', 'num_rounds': 30,
+            'seed': 11}
+    rows, summary = replicate(spec, 4, processes=2)
+    assert len({row['seed'] for row in rows}) == 4
+    assert run_spec(replica_specs(spec, 4)[2]) == rows[2]
+
+    by_name = {row['statistic']: row for row in summary}
+    assert set(by_name) >= {'total_people', 'people_completed', 'max_time',
+                            'min_time', 'avg_time'}
+    completed = by_name['people_completed']
+    assert completed['n'] == 4
+    assert completed['ci_low'] <= completed['mean'] <= completed['ci_high']
+
+
+def test_t_quantile_and_replica_seeds() -> None:
+    """Test the t quantiles used for confidence intervals against tabulated
+    values, and that unseeded replicas are seeded differently from seed 0.
+    """
+    for p, df, expected in [(0.975, 1, 12.7062), (0.975, 2, 4.3027),
+                            (0.995, 3, 5.8409), (0.975, 4, 2.7764),
+                            (0.995, 5, 4.0321), (0.975, 29, 2.0452),
+                            (0.975, 60, 2.0003), (0.025, 9, -2.2622)]:
+        assert t_quantile(p, df) == pytest.approx(expected, abs=1e-4)
+    assert replica_seed(None, 0) == replica_seed(None, 0)
+    assert replica_seed(None, 0) != replica_seed(0, 0)
+    assert replica_seed(None, 1) != replica_seed(0, 1)
+
+
+def test_benchmark_case_and_regressions(monkeypatch) -> None:
+    """Test that a benchmark case reports its throughput from untimed runs
+    and its stage times from a timed one, and that only slowdowns beyond the
+    tolerance are flagged as regressions.
+    """
+    import benchmark
+    timers = []
+    build = benchmark._build
+
+    def record_timer(case, elevator_capacity, seed, timer=None):
+        timers.append(timer)
+        return build(case, elevator_capacity, seed, timer)
+
+    monkeypatch.setattr(benchmark, '_build', record_timer)
+    case = {'num_floors': 6, 'num_elevators': 2, 'num_people_per_round': 3,
+            'moving_algorithm': 'ShortSighted', 'engine': 'object'}
+    result = run_case(case, 20, repeats=2)
+    assert timers[:2] == [None, None]
+    assert sum(timer is not None for timer in timers) == 1
+    assert result['rounds_per_sec'] > 0
+    assert result['people_per_sec'] == pytest.approx(
+        3 * result['rounds_per_sec'])
+    assert set(result['stage_seconds']) == set(STAGES)
+
+    baseline = [dict(result, rounds_per_sec=100.0)]
+    assert find_regressions([dict(result, rounds_per_sec=95.0)],
+                            baseline) == []
+    assert len(find_regressions([dict(result, rounds_per_sec=80.0)],
+                                baseline)) == 1
+
+
+@pytest.mark.parametrize('engine', ['object', 'numpy'])
+def test_stage_timer(tmp_path, engine) -> None:
+    """Test that a stage timer counts every stage of every round, reports to
+    its observers, and does not change the simulation's results.
+    """
+    path = str(tmp_path / 'timing.json')
+    timer = StageTimer([JSONReportObserver(path)])
+    spec = {'num_rounds': 25, 'seed': 5, 'engine': engine}
+    untimed = run_spec(spec)
+    random.seed(5)
+    config = make_config(spec)
+    config['timer'] = timer
+    assert Simulation(config).run(25) == {
+        key: value for key, value in untimed.items()
+        if key not in DEFAULT_SPEC}
+
+    assert timer.calls == {stage: 25 for stage in STAGES}
+    assert timer.seconds['moving_algorithm'] <= \
+        timer.seconds['move_elevators']
+    with open(path) as file:
+        report = json.load(file)
+    assert report['num_rounds'] == 25
+    assert report['stages']['handle_boarding']['calls'] == 25
+
+
+def test_compare_uses_common_arrivals() -> None:
+    """Test that compared algorithms see identical recorded arrivals, and
+    that the paired differences are summarized against the baseline.
+    """
+    recorded = record_arrivals(FileArrivals(5, 'sample_arrivals.csv'), 8)
+    assert recorded.next_arrival_round(2) == 3
+    assert recorded.next_arrival_round(6) is None
+    assert [(p.start, p.target) for p in recorded.generate(1)[5]] == [(5, 3)]
+
+    spec = {'num_rounds': 40, 'seed': 17, 'num_people_per_round': 3}
+    rows, summary = compare(spec, ['PushyPassenger', 'ShortSighted'],
+                            num_replicas=3, processes=2)
+    assert len(rows) == 6
+    for pushy, short in zip(rows[::2], rows[1::2]):
+        assert pushy['seed'] == short['seed']
+        assert pushy['moving_algorithm'] == 'PushyPassenger'
+        assert pushy['total_people'] == short['total_people']
+
+    by_name = {row['statistic']: row for row in summary}
+    assert {row['baseline'] for row in summary} == {'PushyPassenger'}
+    assert by_name['total_people']['mean'] == 0
+    assert by_name['avg_time']['mean'] == pytest.approx(
+        sum(short['avg_time'] - pushy['avg_time']
+            for pushy, short in zip(rows[::2], rows[1::2])) / 3)
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['a1_sample_test.py'])
@@ -12,17 +12,25 @@ See the 'Arrival generation algorithms' and 'Elevator moving algorithsm'
 sections of the assignment handout for a complete description of each algorithm
 you are expected to implement in this file.
 """
+import bisect
 import csv
 from enum import Enum
+import gzip
 import random
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
 
-from entities import Person, Elevator
+from entities import Person, Elevator, WaitingFloors
 
 
 ###############################################################################
 # Arrival generation algorithms
 ###############################################################################
+# The number of people RandomArrivals and PoissonArrivals sample at once
+_BLOCK_PEOPLE = 1 << 16
+# The most rounds PoissonArrivals samples at once
+_BLOCK_ROUNDS = 1 << 14
+
+
 class ArrivalGenerator:
     """An algorithm for specifying arrivals at each round of the simulation.
 
@@ -60,6 +68,32 @@ class ArrivalGenerator:
         """
         raise NotImplementedError
 
+    def generate_floors(self, round_num: int) -> Tuple[Any, Any]:
+        """Return the start and target floors of the new arrivals at the given
+        round, as two sequences (lists or NumPy arrays) in which the people
+        of each start floor are together, floors in the order generate
+        returns them.
+
+        The numpy simulation engine uses this to avoid Person objects. By
+        default, the arrivals are taken from generate.
+        """
+        starts = []
+        targets = []
+        for floor, people in self.generate(round_num).items():
+            for person in people:
+                starts.append(floor)
+                targets.append(person.target)
+        return starts, targets
+
+    def next_arrival_round(self, round_num: int) -> Optional[int]:
+        """Return the first round, at or after <round_num>, in which people
+        may arrive, or None if nobody arrives from <round_num> on.
+
+        The event-driven simulation engine skips the rounds before it. By
+        default, people may arrive in any round.
+        """
+        return round_num
+
 
 class RandomArrivals(ArrivalGenerator):
     """Generate a fixed number of random people each round.
@@ -70,34 +104,481 @@ class RandomArrivals(ArrivalGenerator):
     as ArrivalGenerator. So if you choose to to override the initializer, make
     sure to keep the header the same!
 
-    Hint: look up the 'sample' function from random.
+    Arrivals are sampled with NumPy, in blocks of many rounds at once, and
+    handed out one round per call to generate. Each person's start floor is
+    uniform, and their target floor is uniform over the other floors: it is
+    start + k, wrapping around the top floor, for k uniform in
+    1..max_floor - 1, so no sample is ever rejected.
+
+    Each block is sampled by its own NumPy generator, seeded with this
+    generator's seed and the block's number. The seed is drawn from the
+    random module when the first block is sampled, so seeding the random
+    module makes the arrivals reproducible.
+
+    Generators can be pickled: only the seed and the position in the current
+    block are kept, and an unpickled generator samples its block again when
+    it next generates arrivals.
+
+    === Private Attributes ===
+    _seed: the seed of the blocks, or None until the first block is sampled
+    _block: the number of the current block
+    _starts: the start floor of each person in the current block, one row per
+             round, or None if the block has not been sampled
+    _targets: the target floor of each person in the current block, one row
+              per round, or None if the block has not been sampled
+    _next_row: the row of the current block handed out next
     """
+    _seed: Optional[int]
+    _block: int
+    _starts: Optional[Any]
+    _targets: Optional[Any]
+    _next_row: int
+
     def __init__(self, max_floor: int, num_people: Optional[int]) -> None:
         ArrivalGenerator.__init__(self, max_floor, num_people)
         self.max_floor = max_floor
         self.num_people = num_people
-        
+        self._seed = None
+        self._block = 0
+        self._starts = None
+        self._targets = None
+        self._next_row = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of this generator for pickling, without the
+        sampled block.
+        """
+        state = dict(self.__dict__)
+        del state['_starts']
+        del state['_targets']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore a pickled generator, which samples its block again when
+        it next generates arrivals.
+        """
+        self.__dict__.update(state)
+        self._starts = None
+        self._targets = None
+
     def generate(self, round_num: int) -> Dict[int, List[Person]]:
-        #new_people = []
+        starts, targets = self.generate_floors(round_num)
         newPeople = {}
-        for i in range(self.num_people):
-            start = random.randint(1, self.max_floor)
-            target = random.randint(1, self.max_floor)
-            while target == start:
-                start = random.randint(1, self.max_floor)
-                target = random.randint(1, self.max_floor)
+        for start, target in zip(starts.tolist(), targets.tolist()):
             person = Person(start, target, 0)
-            if start in newPeople.keys():
+            if start in newPeople:
                 newPeople[start].append(person)
             else:
                 newPeople[start] = [person]
         return newPeople
 
+    def generate_floors(self, round_num: int) -> Tuple[Any, Any]:
+        """Return the start and target floors of the new arrivals at the given
+        round, as two NumPy arrays in order of arrival.
+
+        This hands out the same arrivals as generate, without creating Person
+        objects. Unlike the default, the people of a floor are not together,
+        but in the same order relative to each other.
+        """
+        if self._starts is None:
+            self._sample_block(self._block)
+        if self._next_row == len(self._starts):
+            self._sample_block(self._block + 1)
+            self._next_row = 0
+        row = self._next_row
+        self._next_row += 1
+        return self._starts[row], self._targets[row]
+
+    def next_arrival_round(self, round_num: int) -> Optional[int]:
+        if not self.num_people:
+            return None
+        return round_num
+
+    def _sample_block(self, block: int) -> None:
+        """Sample the arrivals of the given block of rounds, and make it the
+        current block.
+        """
+        # NumPy is only needed once arrivals are generated.
+        import numpy as np
+        if self._seed is None:
+            self._seed = random.getrandbits(64)
+        rng = np.random.default_rng([self._seed, block])
+        num_people = self.num_people or 0
+        num_rounds = max(1, _BLOCK_PEOPLE // max(1, num_people))
+        shape = (num_rounds, num_people)
+        self._starts = rng.integers(1, self.max_floor + 1, shape)
+        offsets = rng.integers(1, self.max_floor, shape)
+        self._targets = (self._starts - 1 + offsets) % self.max_floor + 1
+        self._block = block
+
+
+class TrafficPattern:
+    """The traffic in a building from some round on, for PoissonArrivals.
+
+    === Attributes ===
+    start_round: the first round of this pattern
+    rate: the mean number of people arriving per round
+    origin_weights: the relative chance of each floor being a new arrival's
+                    start floor, floor 1 first; None for all floors alike
+    destination_weights: the relative chance of each floor being a new
+                         arrival's target floor (among the floors other than
+                         their start floor), floor 1 first; None for all
+                         floors alike
+
+    === Representation Invariants ===
+    start_round >= 0
+    rate >= 0
+    """
+    start_round: int
+    rate: float
+    origin_weights: Optional[List[float]]
+    destination_weights: Optional[List[float]]
+
+    def __init__(self, start_round: int, rate: float,
+                 origin_weights: Optional[List[float]] = None,
+                 destination_weights: Optional[List[float]] = None) -> None:
+        self.start_round = start_round
+        self.rate = rate
+        self.origin_weights = origin_weights
+        self.destination_weights = destination_weights
+
+
+class PoissonArrivals(ArrivalGenerator):
+    """Generate a random, Poisson-distributed number of people each round,
+    following a profile of traffic patterns that changes over time.
+
+    The profile is a list of TrafficPatterns in order of start_round, the
+    first starting at round 0; each is in effect until the next one starts.
+    If a period is given, the profile repeats every <period> rounds, so a
+    profile for one day can be simulated for many days.
+
+    For example, an office tower's morning up-peak is a high rate with
+    most of the origin weight on floor 1, and its evening down-peak a high
+    rate with most of the destination weight on floor 1.
+
+    Like RandomArrivals, arrivals are sampled with NumPy in blocks of many
+    consecutive rounds at once, each by its own generator seeded with this
+    generator's seed and the block's number; the seed is drawn from the
+    random module when the first block is sampled. So the arrivals of a
+    round only depend on that seed, not on which rounds were asked for
+    before, and the block of any round is sampled directly. Each block is
+    sampled in a few vectorized steps per pattern: the number of arrivals of
+    every round, then all their start floors, then all their target floors,
+    each drawn from the target weights of the floors other than its start
+    floor.
+
+    Generators can be pickled without their current block, which is sampled
+    again when it is next needed.
+
+    === Attributes ===
+    profile: the traffic patterns, in order of start_round
+    period: the number of rounds after which the profile repeats, or None
+
+    === Private Attributes ===
+    _seed: the seed of the blocks, or None until the first block is sampled
+    _rng: the NumPy random generator of the current block, or None if no
+          block has been sampled
+    _block_rounds: the number of rounds in each block; block number b holds
+                   rounds b * _block_rounds to (b + 1) * _block_rounds - 1
+    _block_start: the first round of the current block
+    _offsets: where the arrivals of each round of the current block start in
+              _starts and _targets; the arrivals of round _block_start + i
+              are at _offsets[i]:_offsets[i + 1]
+    _starts: the start floors of the arrivals of the current block
+    _targets: the target floors of the arrivals of the current block
+
+    === Representation Invariants ===
+    profile[0].start_round == 0
+    period is None or period > profile[-1].start_round
+    """
+    profile: List[TrafficPattern]
+    period: Optional[int]
+    _seed: Optional[int]
+    _rng: Optional[Any]
+    _block_rounds: int
+    _block_start: int
+    _offsets: Optional[Any]
+    _starts: Optional[Any]
+    _targets: Optional[Any]
+
+    def __init__(self, max_floor: int, profile: Any,
+                 period: Optional[int] = None) -> None:
+        """Initialize a new PoissonArrivals with the given profile.
+
+        <profile> is a list of TrafficPatterns, or a single mean number of
+        arrivals per round for traffic that never changes, with all floors
+        alike.
+
+        The num_people attribute of every PoissonArrivals instance is set to
+        None, since the number of arrivals is random.
+        """
+        ArrivalGenerator.__init__(self, max_floor, None)
+        if not isinstance(profile, list):
+            profile = [TrafficPattern(0, profile)]
+        if not profile or profile[0].start_round != 0:
+            raise ValueError('the profile must start at round 0')
+        for pattern in profile:
+            self._check_weights(pattern)
+        self.profile = profile
+        self.period = period
+        self._seed = None
+        self._rng = None
+        peak = max(pattern.rate for pattern in profile)
+        self._block_rounds = int(min(_BLOCK_ROUNDS,
+                                     max(1, _BLOCK_PEOPLE // max(1.0, peak))))
+        self._block_start = 0
+        self._offsets = None
+        self._starts = None
+        self._targets = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of this generator for pickling, without the
+        current block.
+        """
+        state = dict(self.__dict__)
+        for name in ['_rng', '_offsets', '_starts', '_targets']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore a pickled generator, which samples blocks again as they
+        are needed.
+        """
+        self.__dict__.update(state)
+        self._rng = None
+        self._offsets = None
+        self._starts = None
+        self._targets = None
+
+    def generate(self, round_num: int) -> Dict[int, List[Person]]:
+        starts, targets = self.generate_floors(round_num)
+        dic = {}
+        for start, target in zip(starts.tolist(), targets.tolist()):
+            dic.setdefault(start, []).append(Person(start, target, 0))
+        return dic
+
+    def generate_floors(self, round_num: int) -> Tuple[Any, Any]:
+        """Return the start and target floors of the new arrivals at the given
+        round, as two NumPy arrays in order of arrival.
+
+        This hands out the same arrivals as generate, without creating Person
+        objects.
+        """
+        i = self._block_index(round_num)
+        begin, end = self._offsets[i], self._offsets[i + 1]
+        return self._starts[begin:end], self._targets[begin:end]
+
+    def next_arrival_round(self, round_num: int) -> Optional[int]:
+        if self._never_arrive(round_num):
+            return None
+        # Look ahead by the counts of arrivals alone, keeping the current
+        # block for the rounds the simulation has yet to generate.
+        while True:
+            block, i = divmod(round_num, self._block_rounds)
+            if (self._offsets is not None and
+                    self._block_start == round_num - i):
+                counts = self._offsets[1:] - self._offsets[:-1]
+            else:
+                counts = self._block_counts(block)[1]
+            busy = counts[i:].nonzero()[0]
+            if busy.size > 0:
+                return round_num + int(busy[0])
+            round_num += len(counts) - i
+
+    def rates(self, first_round: int, num_rounds: int) -> Any:
+        """Return the mean number of arrivals of each of the <num_rounds>
+        rounds from <first_round> on, as a NumPy array.
+        """
+        return self._profile_values([pattern.rate for pattern in self.profile],
+                                    first_round, num_rounds)
+
+    def _profile_values(self, values: List[Any], first_round: int,
+                        num_rounds: int) -> Any:
+        """Return, for each of the <num_rounds> rounds from <first_round> on,
+        the value in <values> of the pattern in effect.
+        """
+        import numpy as np
+        rounds = np.arange(first_round, first_round + num_rounds)
+        if self.period is not None:
+            rounds %= self.period
+        starts = [pattern.start_round for pattern in self.profile]
+        index = np.searchsorted(starts, rounds, side='right') - 1
+        return np.asarray(values)[index]
+
+    def _block_index(self, round_num: int) -> int:
+        """Return the index of <round_num> in the current block, after
+        making the block holding it the current one.
+        """
+        if (self._offsets is None or round_num < self._block_start or
+                round_num >= self._block_start + self._block_rounds):
+            self._sample_block(round_num // self._block_rounds)
+        return round_num - self._block_start
+
+    def _block_counts(self, block: int) -> Tuple[Any, Any]:
+        """Return the NumPy random generator of the given block of rounds,
+        and the number of arrivals of each of its rounds, which that
+        generator draws first.
+        """
+        # NumPy is only needed once arrivals are generated.
+        import numpy as np
+        if self._seed is None:
+            self._seed = random.getrandbits(64)
+        rng = np.random.default_rng([self._seed, block])
+        first_round = block * self._block_rounds
+        return rng, rng.poisson(self.rates(first_round, self._block_rounds))
+
+    def _sample_block(self, block: int) -> None:
+        """Sample the arrivals of the given block of rounds, and make it the
+        current block.
+        """
+        import numpy as np
+        self._rng, counts = self._block_counts(block)
+        num_rounds = self._block_rounds
+        first_round = block * num_rounds
+        offsets = np.zeros(num_rounds + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        # Sample every arrival of the block under the pattern of its round.
+        pattern_of_round = self._profile_values(
+            list(range(len(self.profile))), first_round, num_rounds)
+        pattern_of_person = np.repeat(pattern_of_round, counts)
+        starts = np.zeros(offsets[-1], dtype=np.int64)
+        targets = np.zeros(offsets[-1], dtype=np.int64)
+        for index in np.unique(pattern_of_person).tolist():
+            people = np.flatnonzero(pattern_of_person == index)
+            starts[people], targets[people] = self._sample_people(
+                self.profile[index], people.size)
+
+        self._block_start = first_round
+        self._offsets = offsets
+        self._starts = starts
+        self._targets = targets
+
+    def _sample_people(self, pattern: TrafficPattern,
+                       count: int) -> Tuple[Any, Any]:
+        """Return the start and target floors of <count> people arriving
+        under <pattern>.
+        """
+        import numpy as np
+        origin = self._weights(pattern.origin_weights)
+        destination = self._weights(pattern.destination_weights)
+        starts = self._rng.choice(self.max_floor, size=count,
+                                  p=origin / origin.sum()) + 1
+
+        # Draw a point in the destination weights with the start floor's
+        # weight cut out, and find the floor it falls on.
+        bounds = np.cumsum(destination)
+        own = destination[starts - 1]
+        point = self._rng.random(count) * (bounds[-1] - own)
+        point = np.where(point >= bounds[starts - 1] - own, point + own,
+                         point)
+        targets = np.minimum(np.searchsorted(bounds, point, side='right'),
+                             self.max_floor - 1) + 1
+        # Rounding can land a point on the start floor itself; draw again.
+        clash = np.flatnonzero(targets == starts)
+        while clash.size > 0:
+            resampled = self._rng.choice(self.max_floor, size=clash.size,
+                                         p=destination / bounds[-1]) + 1
+            targets[clash] = resampled
+            clash = clash[resampled == starts[clash]]
+        return starts, targets
+
+    def _weights(self, weights: Optional[List[float]]) -> Any:
+        """Return the given floor weights as a NumPy array, or equal weights
+        if they are None.
+        """
+        import numpy as np
+        if weights is None:
+            return np.ones(self.max_floor)
+        return np.asarray(weights, dtype=float)
+
+    def _check_weights(self, pattern: TrafficPattern) -> None:
+        """Raise ValueError if people arriving under <pattern> could have no
+        possible target floor.
+        """
+        for weights in [pattern.origin_weights, pattern.destination_weights]:
+            if weights is not None and (len(weights) != self.max_floor or
+                                        min(weights) < 0):
+                raise ValueError('floor weights must be max_floor '
+                                 'non-negative numbers')
+        origin = pattern.origin_weights or [1] * self.max_floor
+        destination = pattern.destination_weights or [1] * self.max_floor
+        total = sum(destination)
+        if sum(origin) <= 0 or any(
+                weight > 0 and total - destination[floor] <= 0
+                for floor, weight in enumerate(origin)):
+            raise ValueError(f'no possible target floor in the traffic '
+                             f'pattern starting at round '
+                             f'{pattern.start_round}')
+
+    def _never_arrive(self, round_num: int) -> bool:
+        """Return whether nobody arrives from <round_num> on."""
+        if self.period is not None:
+            return all(pattern.rate == 0 for pattern in self.profile)
+        return all(pattern.rate == 0 for pattern in self.profile
+                   if pattern.start_round >= round_num) and \
+            self.rates(round_num, 1)[0] == 0
+
+
+def office_day(max_floor: int, peak_rate: float,
+               day_rounds: int) -> List[TrafficPattern]:
+    """Return a traffic profile for one working day in an office tower of
+    <max_floor> floors, lasting <day_rounds> rounds.
+
+    The day has a morning up-peak (people arriving on floor 1, going up), a
+    lunch peak (trips both ways between floor 1 and the other floors), an
+    evening down-peak (people leaving for floor 1), quieter inter-floor
+    traffic in between, and an empty night.
+    """
+    lobby = [1.0] + [0.0] * (max_floor - 1)
+    upper = [0.0] + [1.0] * (max_floor - 1)
+    hour = day_rounds / 24
+    return [
+        TrafficPattern(0, 0.0),
+        TrafficPattern(int(7 * hour), peak_rate, lobby, upper),
+        TrafficPattern(int(9 * hour), peak_rate / 10),
+        TrafficPattern(int(12 * hour), peak_rate / 2,
+                       [max_floor - 1.0] + upper[1:],
+                       [max_floor - 1.0] + upper[1:]),
+        TrafficPattern(int(14 * hour), peak_rate / 10),
+        TrafficPattern(int(17 * hour), peak_rate, upper, lobby),
+        TrafficPattern(int(19 * hour), 0.0)
+    ]
+
 
 class FileArrivals(ArrivalGenerator):
     """Generate arrivals from a CSV file.
+
+    The file is streamed forward once, in round order: each call to generate
+    only parses the lines up to and including the requested round, and rounds
+    that have already been handed out are dropped from memory. Asking for an
+    earlier round than the previous call rewinds the file. A line whose
+    round comes before the previous line's raises ValueError when it is read.
+
+    Files whose name ends in '.gz' are read as gzip-compressed CSV, and are
+    decompressed incrementally as the rounds are requested.
+
+    Generators can be pickled: an unpickled generator reopens its file, and
+    continues from the last round it generated.
+
+    === Attributes ===
+    file_name: the name of the CSV file this generator reads from
+
+    === Private Attributes ===
+    _file: the open trace file, or None if it has been fully read
+    _reader: the CSV reader over _file, or None if it has been fully read
+    _pending: the (start, target) pairs of every round that has been read
+              but not yet passed, keyed by round number
+    _read_round: the round number of the last line read from the file
+    _last_round: the round number of the previous call to generate
     """
     file_name: str
+    _file: Optional[TextIO]
+    _reader: Optional[Iterator[List[str]]]
+    _pending: Dict[int, List[Tuple[int, int]]]
+    _read_round: int
+    _last_round: int
+
     def __init__(self, max_floor: int, filename: str) -> None:
         """Initialize a new FileArrivals algorithm from the given file.
 
@@ -106,34 +587,162 @@ class FileArrivals(ArrivalGenerator):
 
         Precondition:
             <filename> refers to a valid CSV file, following the specified
-            format and restrictions from the assignment handout.
+            format and restrictions from the assignment handout, and its
+            lines are sorted by round number.
         """
         ArrivalGenerator.__init__(self, max_floor, None)
         self.file_name = filename
-        
+        self._file = None
+        self._reader = None
+        self._rewind()
+
     def generate(self, round_num: int) -> Dict[int, List[Person]]:
-        # We've provided some of the "reading from csv files" boilerplate code
-        # for you to help you get started.
-        #new_people = []
         dic = {}
-        with open(self.file_name) as csvfile:
-            reader = csv.reader(csvfile)
-            for line in reader:
-                # TODO: complete this. <line> is a list of strings corresponding
-                # to one line of the original file.
-                # You'll need to convert the strings to ints and then process
-                # and store them.
-                if round_num == int(line[0]):
+        for start, target in self._round_pairs(round_num):
+            person = Person(start, target, 0)
+            if start in dic:
+                dic[start].append(person)
+            else:
+                dic[start] = [person]
+        return dic
+
+    def next_arrival_round(self, round_num: int) -> Optional[int]:
+        if round_num < self._last_round:
+            self._rewind()
+        while True:
+            rounds = [r for r, pairs in self._pending.items()
+                      if r >= round_num and pairs]
+            if rounds:
+                return min(rounds)
+            if self._reader is None:
+                return None
+            self._read_until(max(round_num, self._read_round))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of this generator for pickling: everything but
+        the open file, and the rounds read ahead of the last one generated.
+        """
+        state = dict(self.__dict__)
+        for name in ['_file', '_reader', '_pending', '_read_round']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore a pickled generator, reopening its file so that the next
+        round it generates continues where it left off.
+        """
+        self.__dict__.update(state)
+        last_round = self._last_round
+        self._file = None
+        self._reader = None
+        self._rewind()
+        self._last_round = last_round
+
+    def _round_pairs(self, round_num: int) -> List[Tuple[int, int]]:
+        """Return the (start, target) pairs arriving at the given round."""
+        if round_num < self._last_round:
+            self._rewind()
+        if round_num != self._last_round:
+            for old_round in [r for r in self._pending if r < round_num]:
+                del self._pending[old_round]
+            self._last_round = round_num
+        self._read_until(round_num)
+        return self._pending.get(round_num, [])
+
+    def _read_until(self, round_num: int) -> None:
+        """Read lines from the file until one for a later round than
+        <round_num> has been read, or the file is exhausted.
+        """
+        while self._reader is not None and self._read_round <= round_num:
+            line = next(self._reader, None)
+            if line is None:
+                self._close()
+            elif line:
+                line_round = int(line[0])
+                if line_round < self._read_round:
+                    raise ValueError(
+                        f'{self.file_name!r}, line {self._reader.line_num}: '
+                        f'round {line_round} comes after round '
+                        f'{self._read_round}')
+                self._read_round = line_round
+                if self._read_round >= self._last_round:
+                    pairs = self._pending.setdefault(self._read_round, [])
                     for i in range(1, len(line) - 1, 2):
-                        start = int(line[i])
-                        target = int(line[i + 1])
-                        person = Person(start, target, 0)
-                        if start in dic.keys():
-                            dic[start].append(person)
-                        else:
-                            dic[start] = [person]
+                        pairs.append((int(line[i]), int(line[i + 1])))
+
+    def _rewind(self) -> None:
+        """Reopen the file and start reading it from the beginning."""
+        self._close()
+        if self.file_name.endswith('.gz'):
+            self._file = gzip.open(self.file_name, 'rt', newline='')
+        else:
+            self._file = open(self.file_name, newline='')
+        self._reader = csv.reader(self._file)
+        self._pending = {}
+        self._read_round = -1
+        self._last_round = -1
+
+    def _close(self) -> None:
+        """Close the file, if it is still open."""
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._reader = None
+
+
+class RecordedArrivals(ArrivalGenerator):
+    """Generate arrivals recorded in memory, such as a stream recorded once
+    from another generator and replayed to several simulations.
+
+    Every call to generate returns new Person objects, so the same recorded
+    round can be replayed any number of times.
+
+    === Private Attributes ===
+    _rounds: the (start, target) pairs arriving at each round with
+             arrivals, keyed by round number
+    _arrival_rounds: the keys of _rounds, in increasing order
+    """
+    _rounds: Dict[int, List[Tuple[int, int]]]
+    _arrival_rounds: List[int]
+
+    def __init__(self, max_floor: int,
+                 rounds: Dict[int, List[Tuple[int, int]]]) -> None:
+        """Initialize a new RecordedArrivals replaying the given (start,
+        target) pairs of each round.
+
+        The num_people attribute of every RecordedArrivals instance is set to
+        None, since the number of arrivals depends on the recording.
+        """
+        ArrivalGenerator.__init__(self, max_floor, None)
+        self._rounds = {round_num: list(pairs)
+                        for round_num, pairs in rounds.items() if pairs}
+        self._arrival_rounds = sorted(self._rounds)
+
+    def generate(self, round_num: int) -> Dict[int, List[Person]]:
+        dic = {}
+        for start, target in self._rounds.get(round_num, []):
+            dic.setdefault(start, []).append(Person(start, target, 0))
         return dic
-                
+
+    def next_arrival_round(self, round_num: int) -> Optional[int]:
+        i = bisect.bisect_left(self._arrival_rounds, round_num)
+        if i == len(self._arrival_rounds):
+            return None
+        return self._arrival_rounds[i]
+
+
+def record_arrivals(generator: ArrivalGenerator,
+                    num_rounds: int) -> RecordedArrivals:
+    """Return the arrivals <generator> generates in rounds 0 to
+    num_rounds - 1, recorded in memory.
+    """
+    rounds = {}
+    for round_num in range(num_rounds):
+        arrivals = generator.generate(round_num)
+        rounds[round_num] = [(person.start, person.target)
+                             for people in arrivals.values()
+                             for person in people]
+    return RecordedArrivals(generator.max_floor, rounds)
 
 
 ###############################################################################
@@ -152,9 +761,31 @@ class Direction(Enum):
     DOWN = -1
 
 
+def waiting_floors(waiting: Dict[int, List[Person]]) -> WaitingFloors:
+    """Return <waiting> as a WaitingFloors, so that it can be queried for
+    occupied floors.
+
+    The simulation's own WaitingFloors is returned as is; a plain dictionary
+    is copied into a new one.
+    """
+    if isinstance(waiting, WaitingFloors):
+        return waiting
+    return WaitingFloors(waiting)
+
+
 class MovingAlgorithm:
     """An algorithm to make decisions for moving an elevator at each round.
+
+    === Attributes ===
+    stable_directions: whether, as long as nobody arrives, boards or leaves,
+                       this algorithm keeps each elevator moving in the same
+                       direction (or standing still) until it reaches a
+                       floor where someone could board or leave. The
+                       event-driven simulation engine only skips rounds for
+                       algorithms where this is True.
     """
+    stable_directions: bool = False
+
     def move_elevators(self,
                        elevators: List[Elevator],
                        waiting: Dict[int, List[Person]],
@@ -165,6 +796,16 @@ class MovingAlgorithm:
         a dictionary mapping floor number to a list of people waiting on
         that floor, and the maximum floor number in the simulation.
 
+        The simulation only includes floors where someone is waiting, and
+        passes its own waiting queues (entities.WaitingQueue) as the values.
+        These support len, iteration and indexing like a list, and must not
+        be modified.
+
+        The dictionary the simulation passes is an entities.WaitingFloors,
+        which also answers lowest_floor(), highest_floor() and
+        nearest_floor(floor) in O(log F) time. Use waiting_floors(waiting)
+        to get one even when given a plain dictionary.
+
         Note that each returned direction should be valid:
             - An elevator at Floor 1 cannot move down.
             - An elevator at the top floor cannot move up.
@@ -188,7 +829,6 @@ class RandomAlgorithm(MovingAlgorithm):
             (elevator.curFloor == max_floor and direction == Direction.UP):
                 direction = random.sample([Direction.DOWN, Direction.STAY, Direction.UP], 1)[0]
             directions.append(direction)
-            print(direction)
         return directions
 
 class PushyPassenger(MovingAlgorithm):
@@ -200,30 +840,26 @@ class PushyPassenger(MovingAlgorithm):
     If the elevator isn't empty, it moves towards the target floor of the
     *first* passenger who boarded the elevator.
     """
+    stable_directions = True
+
     def move_elevators(self,
                        elevators: List[Elevator],
                        waiting: Dict[int, List[Person]],
                        max_floor: int) -> List[Direction]:
         directions = []
-        waiting_people = max_floor
-        if len(waiting) == 0:
-            waiting_people = -1
-        else:
-            for floor in range(1, max_floor + 1):
-                if floor in waiting.keys():
-                    if len(waiting[floor]) > 0:
-                        waiting_people = floor
-                        break
+        waiting = waiting_floors(waiting)
+        waiting_people = waiting.lowest_floor()
         for elevator in elevators:
-            if len(elevator.passengers) == 0:
-                if len(waiting) == 0 or waiting_people == elevator.curFloor:
+            first = elevator.first_passenger()
+            if first is None:
+                if waiting_people is None or waiting_people == elevator.curFloor:
                     directions.append(Direction.STAY)
                 elif waiting_people > elevator.curFloor:
                     directions.append(Direction.UP)
                 else:
                     directions.append(Direction.DOWN)
             else:
-                if elevator.passengers[0].target > elevator.curFloor:
+                if first.target > elevator.curFloor:
                     directions.append(Direction.UP)
                 else:
                     directions.append(Direction.DOWN)
@@ -241,19 +877,18 @@ class ShortSighted(MovingAlgorithm):
 
     In this case, the order in which people boarded does *not* matter.
     """
+    stable_directions = True
+
     def move_elevators(self,
                        elevators: List[Elevator],
                        waiting: Dict[int, List[Person]],
                        max_floor: int) -> List[Direction]:
         directions = []
+        waiting = waiting_floors(waiting)
         for elevator in elevators:
-            if len(elevator.passengers) == 0:
-                nextFloor = 0
-                for floor in waiting.keys():
-                    assert len(waiting[floor]) > 0
-                    if nextFloor == 0 or abs(floor - elevator.curFloor) < abs(nextFloor - elevator.curFloor):
-                        nextFloor = floor
-                if nextFloor == 0:
+            if elevator.passenNum == 0:
+                nextFloor = waiting.nearest_floor(elevator.curFloor)
+                if nextFloor is None:
                     directions.append(Direction.STAY)
                 elif nextFloor > elevator.curFloor:
                     directions.append(Direction.UP)
@@ -262,13 +897,8 @@ class ShortSighted(MovingAlgorithm):
                 else:
                     directions.append(Direction.STAY)
             else:
-                nextFloor = 0
-                for person in elevator.passengers:
-                    if nextFloor == 0 or abs(person.target - elevator.curFloor) < abs(closest - elevator.curFloor):
-                        nextFloor = person.target
-                if nextFloor == 0:
-                    directions.append(Direction.STAY)
-                elif nextFloor > elevator.curFloor:
+                nextFloor = elevator.nearest_target(elevator.curFloor)
+                if nextFloor > elevator.curFloor:
                     directions.append(Direction.UP)
                 elif nextFloor < elevator.curFloor:
                     directions.append(Direction.DOWN)
@@ -282,7 +912,8 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-io': ['__init__'],
-        'extra-imports': ['entities', 'random', 'csv', 'enum'],
+        'extra-imports': ['entities', 'random', 'csv', 'enum', 'gzip',
+                          'bisect', 'numpy'],
         'max-nested-blocks': 4,
         'disable': ['R0201']
     })
@@ -0,0 +1,521 @@
+"""
+=== Module Description ===
+This file contains the ArrayEngine class, an alternative engine for
+simulation.Simulation that is selected with config['engine'] = 'numpy'.
+
+Instead of Person and Elevator objects, the engine keeps the elevators as
+arrays (floor, load, capacity), the people riding them in a table with one
+row per elevator and one slot per place in it (start, target, arrival round,
+boarding order), and the people waiting in a FloorQueues, which holds one
+first-in, first-out queue of (target, arrival round) pairs per floor. Each
+stage of a round is a handful of vectorized array operations on the people
+who arrive, board or leave in it, the riders' table and the per-floor and
+per-elevator arrays, so the cost of a round does not grow with the number
+of people waiting in the building.
+
+The engine follows the object engine's rules exactly (including the order in
+which people queue and board, and how ShortSighted breaks ties), so both
+engines report the same statistics for the same arrivals.
+
+ShortSighted and PushyPassenger are evaluated directly on the arrays, and
+RandomAlgorithm, which only looks at the elevators' floors, is given
+elevators on the right floors. Any other MovingAlgorithm is given freshly
+built Elevator and Person objects each round, so it works unchanged, only
+more slowly.
+"""
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+import algorithms
+from entities import Elevator, Person, RoundClock, WaitingFloors
+from metrics import WaitTimeHistogram
+from timing import timed
+
+# The smallest number of places a floor's queue is given in a FloorQueues
+_MIN_ROOM = 16
+
+# The order given to the empty slots of the riders' table, which sorts after
+# every rider
+_NO_ORDER = np.iinfo(np.int64).max
+
+
+class FloorQueues:
+    """First-in, first-out queues of waiting people, one per floor, each
+    person stored as their target floor and arrival round.
+
+    All queues share one pool of places. Each floor's queue is a ring of
+    places in that pool, holding its people from position head to tail - 1,
+    where head and tail only ever grow. A ring that gets full is moved to a
+    ring twice as big at the end of the pool (which leaves behind fewer
+    places than the rings in use), so adding a person takes amortized
+    constant time, and taking people from the front of a queue takes time
+    linear in the number of people taken.
+
+    === Private Attributes ===
+    _head: the position of the front of each floor's queue
+    _tail: the position after the back of each floor's queue
+    _base: the index in the pool of the first place of each floor's ring
+    _room: the number of places in each floor's ring
+    _target: the target floor of the person in each place of the pool
+    _arrival: the arrival round of the person in each place of the pool
+    _end: the number of places of the pool in use by rings, past or present
+
+    === Representation Invariants ===
+    0 <= _tail[f] - _head[f] <= _room[f] for every floor f.
+    The rings of the floors do not overlap, and lie in _target[:_end].
+    """
+    _head: np.ndarray
+    _tail: np.ndarray
+    _base: np.ndarray
+    _room: np.ndarray
+    _target: np.ndarray
+    _arrival: np.ndarray
+    _end: int
+
+    def __init__(self, num_floors: int) -> None:
+        """Initialize empty queues for floors 1 to <num_floors>.
+
+        The queues are indexed by floor number; floor 0 is never used.
+        """
+        self._head = np.zeros(num_floors + 1, dtype=np.int64)
+        self._tail = np.zeros(num_floors + 1, dtype=np.int64)
+        self._base = np.zeros(num_floors + 1, dtype=np.int64)
+        self._room = np.zeros(num_floors + 1, dtype=np.int64)
+        self._target = np.zeros(0, dtype=np.int64)
+        self._arrival = np.zeros(0, dtype=np.int64)
+        self._end = 0
+
+    def lengths(self) -> np.ndarray:
+        """Return the number of people in each floor's queue."""
+        return self._tail - self._head
+
+    def push(self, floors: np.ndarray, targets: np.ndarray,
+             counts: np.ndarray, round_num: int) -> None:
+        """Add people arriving at <round_num> to the back of the queues.
+
+        <floors> and <targets> are their start and target floors, sorted by
+        start floor, and in order of arrival on each floor; <counts> is the
+        number of them on each floor.
+        """
+        needed = self._tail - self._head + counts
+        if (needed > self._room).any():
+            self._make_room(needed)
+        firsts = self._tail - (counts.cumsum() - counts)
+        positions = np.arange(floors.size) + firsts[floors]
+        places = self._places(floors, positions)
+        self._target[places] = targets
+        self._arrival[places] = round_num
+        self._tail += counts
+
+    def peek(self, floors: np.ndarray, offsets: np.ndarray,
+             counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the targets and arrival rounds of the <counts[i]> people
+        from place <offsets[i]> of the queue of <floors[i]> on, for each i,
+        all one after the other.
+
+        Precondition: offsets[i] + counts[i] <= the length of that queue.
+        """
+        positions = _spans(self._head[floors] + offsets, counts)
+        places = self._places(np.repeat(floors, counts), positions)
+        return self._target[places], self._arrival[places]
+
+    def pop(self, counts: np.ndarray) -> None:
+        """Remove <counts[f]> people from the front of the queue of each
+        floor f.
+        """
+        self._head += counts
+
+    def contents(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the start floors, targets and arrival rounds of everyone
+        in the queues, by floor, each floor's queue front first.
+        """
+        lengths = self.lengths()
+        floors = np.repeat(np.arange(lengths.size), lengths)
+        places = self._places(floors, _spans(self._head, lengths))
+        return floors, self._target[places], self._arrival[places]
+
+    def _places(self, floors: np.ndarray, positions: np.ndarray
+                ) -> np.ndarray:
+        """Return the index in the pool of the given positions of the given
+        floors' queues.
+        """
+        return self._base[floors] + positions % self._room[floors]
+
+    def _make_room(self, needed: np.ndarray) -> None:
+        """Move the ring of every floor with fewer places than it <needed>
+        to a bigger one.
+        """
+        for floor in np.flatnonzero(needed > self._room).tolist():
+            room = max(_MIN_ROOM, 2 * int(self._room[floor]),
+                       int(needed[floor]))
+            self._move(floor, self._end, room)
+            self._end += room
+
+    def _move(self, floor: int, base: int, room: int) -> None:
+        """Move the ring of <floor> to <room> places from <base> on in the
+        pool, which is grown if need be.
+        """
+        if base + room > self._target.size:
+            size = max(2 * self._target.size, base + room)
+            self._target = np.resize(self._target, size)
+            self._arrival = np.resize(self._arrival, size)
+        positions = np.arange(self._head[floor], self._tail[floor])
+        old = self._base[floor] + positions % self._room[floor]
+        new = base + positions % room
+        self._target[new] = self._target[old]
+        self._arrival[new] = self._arrival[old]
+        self._base[floor] = base
+        self._room[floor] = room
+
+
+class ArrayEngine:
+    """A struct-of-arrays engine for running a simulation.
+
+    === Attributes ===
+    arrival_generator: the algorithm used to generate new arrivals.
+    moving_algorithm: the algorithm used to decide how to move elevators
+    num_floors: the number of floors
+    statistics: the statistics of the simulation this engine runs, which
+                the engine updates in place
+    wait_times: the wait time histogram of the simulation this engine runs,
+                which the engine records completed rides in
+    clock: the current round of the simulation this engine runs, which the
+           engine advances at the end of every round
+
+    === Private Attributes ===
+    _queues: the people waiting on each floor, in order of arrival
+    _rider_start: the start floor of the rider in each slot of each
+                  elevator
+    _rider_target: the target floor of the rider in each slot, or 0 for an
+                   empty slot
+    _rider_arrival: the arrival round of the rider in each slot
+    _rider_order: the position of the rider in each slot in the order of
+                  boarding, or _NO_ORDER for an empty slot
+    _rows: the index of each elevator, for picking one slot per row of the
+           rider arrays
+    _floor: the floor each elevator is on
+    _load: the number of people riding each elevator
+    _capacity: the capacity of each elevator
+    _occupied_since: for each floor, the value of _next_order when people
+                     started waiting on it, or -1 if nobody is waiting there
+    _next_order: the next value to hand out in _rider_order or
+                 _occupied_since
+    _recorder: the RoundRecorder that records every round, or None
+    _timer: the StageTimer that times the stages of every round, or None
+
+    === Representation Invariants ===
+    The rider arrays have one row per elevator, and as many slots as the
+    largest capacity.
+    _load[e] is the number of non-empty slots in row e of the rider arrays.
+    _occupied_since[f] >= 0 exactly when somebody is waiting on floor f.
+    """
+    arrival_generator: algorithms.ArrivalGenerator
+    moving_algorithm: algorithms.MovingAlgorithm
+    num_floors: int
+    statistics: Dict[str, Any]
+    wait_times: WaitTimeHistogram
+    clock: RoundClock
+    _queues: FloorQueues
+    _rider_start: np.ndarray
+    _rider_target: np.ndarray
+    _rider_arrival: np.ndarray
+    _rider_order: np.ndarray
+    _rows: np.ndarray
+    _floor: np.ndarray
+    _load: np.ndarray
+    _capacity: np.ndarray
+    _occupied_since: np.ndarray
+    _next_order: int
+    _recorder: Optional[Any]
+    _timer: Optional[Any]
+
+    def __init__(self, config: Dict[str, Any], statistics: Dict[str, Any],
+                 wait_times: WaitTimeHistogram, clock: RoundClock) -> None:
+        """Initialize a new engine for the given simulation configuration,
+        reporting into the given statistics and wait time histogram, and
+        continuing from the round of the given clock.
+        """
+        self.arrival_generator = config['arrival_generator']
+        self.moving_algorithm = config['moving_algorithm']
+        self.num_floors = config['num_floors']
+        self.statistics = statistics
+        self.wait_times = wait_times
+        self.clock = clock
+
+        num_elevators = config['num_elevators']
+        self._rows = np.arange(num_elevators)
+        self._floor = np.ones(num_elevators, dtype=np.int64)
+        self._load = np.zeros(num_elevators, dtype=np.int64)
+        self._capacity = np.full(num_elevators, config['elevator_capacity'],
+                                 dtype=np.int64)
+
+        self._queues = FloorQueues(self.num_floors)
+        slots = (num_elevators, max(1, config['elevator_capacity']))
+        self._rider_start = np.zeros(slots, dtype=np.int64)
+        self._rider_target = np.zeros(slots, dtype=np.int64)
+        self._rider_arrival = np.zeros(slots, dtype=np.int64)
+        self._rider_order = np.full(slots, _NO_ORDER, dtype=np.int64)
+
+        self._occupied_since = np.full(self.num_floors + 1, -1,
+                                       dtype=np.int64)
+        self._next_order = 0
+        self._recorder = config.get('recorder')
+        self._timer = config.get('timer')
+
+    def run(self, num_rounds: int) -> None:
+        """Run the simulation for the given number of rounds, continuing
+        from the clock's round, and timing each stage with the timer, if
+        there is one.
+        """
+        timer = self._timer
+        first = self.clock.round_num
+        for i in range(first, first + num_rounds):
+            arrivals = self.statistics['total_people']
+            completions = self.statistics['people_completed']
+            with timed(timer, 'generate_arrivals'):
+                self.generate_arrivals(i)
+            with timed(timer, 'handle_leaving'):
+                self.handle_leaving(i)
+            with timed(timer, 'handle_boarding'):
+                self.handle_boarding(i)
+            with timed(timer, 'move_elevators'):
+                directions = self.move_elevators(i)
+            if self._recorder is not None:
+                self._record_round(i, directions, arrivals, completions)
+            self.clock.round_num = i + 1
+
+    def _record_round(self, round_num: int, directions: np.ndarray,
+                      arrivals: int, completions: int) -> None:
+        """Record the end of the given round with the recorder, given the
+        directions the elevators moved in, and the total arrivals and
+        completions before the round.
+        """
+        self._recorder.record_arrays(
+            round_num, self._queues.lengths()[1:],
+            self._load, self._floor, directions,
+            self.statistics['total_people'] - arrivals,
+            self.statistics['people_completed'] - completions)
+
+    ###########################################################################
+    # Stages of a round
+    ###########################################################################
+    def generate_arrivals(self, round_num: int) -> None:
+        """Add the people arriving at the given round to the waiting queues.
+        """
+        starts, targets = self.arrival_generator.generate_floors(round_num)
+        starts = np.asarray(starts, dtype=np.int64)
+        num_new = starts.size
+        self.statistics['total_people'] += num_new
+        if num_new == 0:
+            return
+
+        order = starts.argsort(kind='stable')
+        floors = starts[order]
+        counts = np.bincount(floors, minlength=self.num_floors + 1)
+        # Newly occupied floors are ordered by their first arrival, as
+        # generate groups people by floor in that order.
+        new_floors = ((counts > 0) & (self._occupied_since < 0)).nonzero()[0]
+        since = self._take_order(num_new)
+        if new_floors.size > 0:
+            firsts = counts.cumsum() - counts
+            self._occupied_since[new_floors] = since + order[
+                firsts[new_floors]]
+        self._queues.push(floors,
+                          np.asarray(targets, dtype=np.int64)[order],
+                          counts, round_num)
+
+    def handle_leaving(self, round_num: int) -> None:
+        """Remove the riders whose target is their elevator's floor."""
+        leaving = self._rider_target == self._floor[:, np.newaxis]
+        if not leaving.any():
+            return
+
+        waits = round_num - self._rider_arrival[leaving]
+        self.statistics['max_time'] = max(self.statistics['max_time'],
+                                          int(waits.max()))
+        self.statistics['min_time'] = min(self.statistics['min_time'],
+                                          int(waits.min()))
+        self.statistics['total_time'] += int(waits.sum())
+        self.statistics['people_completed'] += int(waits.size)
+        counts = np.bincount(waits)
+        for value in counts.nonzero()[0].tolist():
+            self.wait_times.record(value, int(counts[value]))
+
+        self._load -= leaving.sum(axis=1)
+        self._rider_target[leaving] = 0
+        self._rider_order[leaving] = _NO_ORDER
+
+    def handle_boarding(self, round_num: int) -> None:
+        """Board waiting people onto the elevators on their floor.
+
+        As in the object engine, elevators are filled in index order, each
+        from the front of its floor's queue.
+        """
+        free = self._capacity - self._load
+        lengths = self._queues.lengths()
+        # The free space of the elevators before each one on its floor, in
+        # index order, tells where in its floor's queue its boarders start.
+        elevator_order = self._floor.argsort(kind='stable')
+        sorted_floors = self._floor[elevator_order]
+        sorted_free = free[elevator_order]
+        free_before = sorted_free.cumsum() - sorted_free
+        free_before -= free_before[np.searchsorted(sorted_floors,
+                                                   sorted_floors)]
+        offsets = np.empty_like(free)
+        offsets[elevator_order] = free_before
+        boarding = np.minimum(np.maximum(lengths[self._floor] - offsets, 0),
+                              free)
+        num_boarding = int(boarding.sum())
+        if num_boarding == 0:
+            return
+
+        targets, arrivals = self._queues.peek(self._floor, offsets, boarding)
+        # Boarders fill the empty slots of their elevator in slot order.
+        empty = self._rider_target == 0
+        slots = empty & (empty.cumsum(axis=1) <= boarding[:, np.newaxis])
+        first = self._take_order(num_boarding)
+        self._rider_start[slots] = np.repeat(self._floor, boarding)
+        self._rider_target[slots] = targets
+        self._rider_arrival[slots] = arrivals
+        self._rider_order[slots] = np.arange(first, first + num_boarding)
+        self._load += boarding
+
+        taken = np.bincount(self._floor, weights=boarding,
+                            minlength=self.num_floors + 1).astype(np.int64)
+        self._queues.pop(taken)
+        self._occupied_since[(taken > 0) & (lengths == taken)] = -1
+
+    def move_elevators(self, round_num: int) -> np.ndarray:
+        """Move the elevators using the moving algorithm, and return the
+        direction each of them moved in.
+        """
+        with timed(self._timer, 'moving_algorithm'):
+            directions = self._choose_directions(round_num)
+        self._floor += directions
+        return directions
+
+    def _choose_directions(self, round_num: int) -> np.ndarray:
+        """Return the direction the moving algorithm moves each elevator in.
+        """
+        if type(self.moving_algorithm) is algorithms.ShortSighted:
+            return self._short_sighted_directions()
+        if type(self.moving_algorithm) is algorithms.PushyPassenger:
+            return self._pushy_passenger_directions()
+        if type(self.moving_algorithm) is algorithms.RandomAlgorithm:
+            return self._random_directions()
+        return self._object_directions(round_num)
+
+    ###########################################################################
+    # Moving algorithms
+    ###########################################################################
+    def _short_sighted_directions(self) -> np.ndarray:
+        """Return the ShortSighted direction of each elevator."""
+        # Each elevator heads for its riders' nearest target, and ties go to
+        # the rider who boarded first.
+        targets = self._rider_target
+        distance = np.abs(targets - self._floor[:, np.newaxis])
+        key = np.where(targets > 0, distance * self._next_order +
+                       self._rider_order, _NO_ORDER)
+        nearest = targets[self._rows, key.argmin(axis=1)]
+        directions = np.where(self._load > 0,
+                              np.sign(nearest - self._floor), 0)
+
+        occupied = (self._occupied_since >= 0).nonzero()[0]
+        empty = (self._load == 0).nonzero()[0]
+        if occupied.size > 0 and empty.size > 0:
+            # Ties go to the floor that has had people waiting the longest,
+            # as the object engine scans its waiting dict in insertion order.
+            distance = np.abs(occupied[np.newaxis, :] -
+                              self._floor[empty, np.newaxis])
+            key = distance * self._next_order + self._occupied_since[occupied]
+            nearest = occupied[np.argmin(key, axis=1)]
+            directions[empty] = np.sign(nearest - self._floor[empty])
+        return directions
+
+    def _pushy_passenger_directions(self) -> np.ndarray:
+        """Return the PushyPassenger direction of each elevator."""
+        first = self._rider_target[self._rows,
+                                   self._rider_order.argmin(axis=1)]
+        directions = np.where(self._load == 0, 0,
+                              np.where(first > self._floor, 1, -1))
+
+        occupied = (self._occupied_since >= 0).nonzero()[0]
+        empty = (self._load == 0).nonzero()[0]
+        if occupied.size > 0 and empty.size > 0:
+            directions[empty] = np.sign(occupied[0] - self._floor[empty])
+        return directions
+
+    def _random_directions(self) -> np.ndarray:
+        """Return the RandomAlgorithm direction of each elevator, which only
+        depends on the elevators' floors.
+        """
+        return self._directions_of(self._elevators(), WaitingFloors())
+
+    def _object_directions(self, round_num: int) -> np.ndarray:
+        """Return the directions chosen by the moving algorithm when given
+        Elevator and Person objects for the current state.
+        """
+        elevators = self._elevators()
+        for elevator, row in enumerate(self._rider_order):
+            for slot in np.argsort(row)[:self._load[elevator]].tolist():
+                elevators[elevator].boarding(Person(
+                    int(self._rider_start[elevator, slot]),
+                    int(self._rider_target[elevator, slot]),
+                    round_num - int(self._rider_arrival[elevator, slot])))
+        queues = {}
+        occupied = np.flatnonzero(self._occupied_since >= 0)
+        for floor in occupied[np.argsort(self._occupied_since[occupied])]:
+            queues[int(floor)] = []
+        floors, targets, arrivals = self._queues.contents()
+        for start, target, arrival in zip(floors.tolist(), targets.tolist(),
+                                          arrivals.tolist()):
+            queues[start].append(Person(start, target, round_num - arrival))
+        return self._directions_of(elevators, WaitingFloors(queues))
+
+    def _directions_of(self, elevators: Any, waiting: WaitingFloors
+                       ) -> np.ndarray:
+        """Return the directions the moving algorithm chooses for the given
+        elevators and waiting people.
+        """
+        directions = self.moving_algorithm.move_elevators(
+            elevators, waiting, self.num_floors)
+        return np.array([direction.value for direction in directions],
+                        dtype=np.int64)
+
+    def _elevators(self) -> Any:
+        """Return new, empty Elevator objects on the elevators' floors."""
+        elevators = []
+        for floor, capacity in zip(self._floor.tolist(),
+                                   self._capacity.tolist()):
+            elevator = Elevator([], self.num_floors, capacity)
+            elevator.curFloor = floor
+            elevators.append(elevator)
+        return elevators
+
+    ###########################################################################
+    # Helpers
+    ###########################################################################
+    def _take_order(self, count: int) -> int:
+        """Reserve <count> consecutive order values, and return the first."""
+        first = self._next_order
+        self._next_order += count
+        return first
+
+
+def _spans(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Return the ranges from <starts[i]> to <starts[i] + counts[i]> (not
+    included), for each i, one after the other.
+    """
+    ends = counts.cumsum()
+    return np.arange(ends[-1] if ends.size else 0) + np.repeat(
+        starts - (ends - counts), counts)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['numpy', 'algorithms', 'entities', 'metrics',
+                          'timing'],
+        'max-nested-blocks': 4
+    })
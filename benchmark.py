@@ -0,0 +1,206 @@
+"""
+=== Module Description ===
+This file contains a benchmark suite for the throughput of headless
+simulations.
+
+Every case of the benchmark matrix (building size, number of elevators,
+arrivals per round, moving algorithm and engine) is run with seeded random
+arrivals, and measured for:
+
+    rounds_per_sec: simulated rounds per second of wall time
+    people_per_sec: arriving people simulated per second of wall time
+    peak_memory_mb: the peak memory allocated by Python during the run
+    stage_seconds: the wall time spent in each stage of the rounds, and in
+                   the moving algorithm (see timing.StageTimer)
+
+The throughputs are measured without a StageTimer, so that they do not
+include its overhead; the stage times come from a separate, timed run.
+
+Results can be saved as a baseline, and later runs compared against it, so
+that optimizations (and regressions) can be proven:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json
+
+See main for all the options.
+"""
+import argparse
+import itertools
+import json
+import sys
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from experiments import make_config
+from simulation import Simulation
+from timing import STAGES, StageTimer
+
+# The default benchmark matrix
+DEFAULT_MATRIX = {
+    'num_floors': [10, 80],
+    'num_elevators': [2, 24],
+    'num_people_per_round': [2, 100],
+    'moving_algorithm': ['RandomAlgorithm', 'PushyPassenger', 'ShortSighted'],
+    'engine': ['object', 'numpy']
+}
+
+
+def case_name(case: Dict[str, Any]) -> str:
+    """Return the name identifying the given benchmark case in baselines."""
+    return (f"{case['moving_algorithm']}/{case['engine']}"
+            f"/floors={case['num_floors']}"
+            f"/elevators={case['num_elevators']}"
+            f"/rate={case['num_people_per_round']}")
+
+
+def expand_matrix(matrix: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Return every benchmark case of the given matrix."""
+    keys = list(matrix)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*(matrix[key] for key in keys))]
+
+
+def _build(case: Dict[str, Any], elevator_capacity: int, seed: int,
+           timer: Optional[StageTimer] = None) -> Simulation:
+    """Return a new, seeded simulation for the given benchmark case, timed by
+    <timer> if it is given.
+    """
+    random.seed(seed)
+    config = make_config(dict(case, elevator_capacity=elevator_capacity))
+    config['timer'] = timer
+    return Simulation(config)
+
+
+def run_case(case: Dict[str, Any], num_rounds: int, repeats: int = 3,
+             elevator_capacity: int = 8, seed: int = 0) -> Dict[str, Any]:
+    """Benchmark one case, and return its measurements.
+
+    Throughputs are taken from the best of <repeats> untimed runs. The stage
+    times and the peak memory are each measured in a separate run, since
+    timing the stages and tracing allocations both slow the simulation down.
+    """
+    best = None
+    for _ in range(repeats):
+        sim = _build(case, elevator_capacity, seed)
+        start = time.perf_counter()
+        stats = sim.run(num_rounds)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, stats)
+    elapsed, stats = best
+
+    timer = StageTimer()
+    _build(case, elevator_capacity, seed, timer).run(num_rounds)
+
+    sim = _build(case, elevator_capacity, seed)
+    tracemalloc.start()
+    sim.run(num_rounds)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'case': case_name(case),
+        'rounds_per_sec': num_rounds / elapsed,
+        'people_per_sec': stats['total_people'] / elapsed,
+        'peak_memory_mb': peak / 2 ** 20,
+        'stage_seconds': dict(timer.seconds),
+        'seconds': elapsed
+    }
+
+
+def run_benchmarks(matrix: Dict[str, List[Any]], num_rounds: int,
+                   repeats: int = 3,
+                   report: Optional[Callable[[Dict[str, Any]], None]] = None
+                   ) -> List[Dict[str, Any]]:
+    """Benchmark every case of <matrix>, one after the other, and return
+    their measurements. Each result is passed to <report> as it is ready.
+    """
+    results = []
+    for case in expand_matrix(matrix):
+        result = run_case(case, num_rounds, repeats)
+        results.append(result)
+        if report is not None:
+            report(result)
+    return results
+
+
+def find_regressions(results: List[Dict[str, Any]],
+                     baseline: List[Dict[str, Any]],
+                     tolerance: float = 0.1) -> List[str]:
+    """Return a description of every case of <results> whose throughput is
+    more than <tolerance> (a fraction) below the same case in <baseline>.
+    """
+    previous = {result['case']: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result['case'])
+        if old is None:
+            continue
+        ratio = result['rounds_per_sec'] / old['rounds_per_sec']
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{result['case']}: {result['rounds_per_sec']:.0f} rounds/s, "
+                f"was {old['rounds_per_sec']:.0f} ({ratio - 1:+.0%})")
+    return regressions
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """Return one line of the benchmark report for <result>."""
+    stages = result['stage_seconds']
+    total = sum(seconds for stage, seconds in stages.items()
+                if stage != 'moving_algorithm') or 1.0
+    shares = ' '.join(f"{stage.split('_')[-1]}={stages[stage] / total:4.0%}"
+                      for stage in STAGES)
+    return (f"{result['case']:<58} {result['rounds_per_sec']:>10.0f} "
+            f"{result['people_per_sec']:>10.0f} "
+            f"{result['peak_memory_mb']:>8.1f}  {shares}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmark suite from the command line, and return the exit
+    status: 1 if a regression was found, and 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark headless simulation throughput.')
+    for key, values in DEFAULT_MATRIX.items():
+        parser.add_argument('--' + key.replace('_', '-'), dest=key,
+                            nargs='+', default=values,
+                            type=str if isinstance(values[0], str) else int)
+    parser.add_argument('--rounds', type=int, default=500,
+                        help='rounds per run (default: 500)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='timed runs per case (default: 3)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='flag regressions against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown that counts as a regression '
+                             '(default: 0.1)')
+    args = parser.parse_args(argv)
+
+    matrix = {key: getattr(args, key) for key in DEFAULT_MATRIX}
+    print(f"{'case':<58} {'rounds/s':>10} {'people/s':>10} {'peak MB':>8}"
+          f"  stage shares")
+    results = run_benchmarks(matrix, args.rounds, args.repeats,
+                             lambda result: print(format_result(result),
+                                                  flush=True))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = find_regressions(results, json.load(file),
+                                           args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,48 +10,115 @@ methods we have provided. However, you can (and should) add new attributes,
 and of course you'll have to implement the methods we've provided, as well
 as add your own methods to complete this assignment.
 
-Finally, note that Person and Elevator each inherit from a kind of sprite found
-in sprites.py; this is to enable their instances to be visualized properly.
-You may not change sprites.py, but are responsible for reading the documentation
-to understand these classes, as well as the abstract methods your classes must
-implement.
+Finally, note that Person and Elevator are plain records that never touch
+Pygame, so that headless simulations stay cheap. When a Visualizer is active,
+it lazily attaches a sprite from sprites.py to each entity it draws, through
+the entity's sprite attribute.
 """
 #from __future__ import annotations
-from typing import List
-from sprites import PersonSprite, ElevatorSprite
+import bisect
+from collections import deque
+from typing import (Any, Deque, Dict, Iterable, Iterator, List, Mapping,
+                    Optional, Sequence, Tuple)
 
 
-class Person(PersonSprite):
+class RoundClock:
+    """The current round of a simulation.
+
+    A simulation shares one clock with every person in it, so that advancing
+    the clock by one round makes everyone wait one round longer at once.
+
+    === Attributes ===
+    round_num: the number of the current round
+
+    === Representation invariants ===
+    round_num >= 0
+    """
+    __slots__ = ('round_num',)
+    round_num: int
+
+    def __init__(self) -> None:
+        self.round_num = 0
+
+
+class Person:
     """A person in the elevator simulation.
 
+    While a person is in a simulation, their wait time is not stored but
+    derived from the simulation's clock and the round they arrived in.
+
     === Attributes ===
     start: the floor this person started on
     target: the floor this person wants to go to
     wait_time: the number of rounds this person has been waiting
+    arrival_round: the round this person arrived in, or None if this person
+                   has not been added to a simulation
+    sprite: the sprite drawing this person, or None if this person
+            has not been visualized
+
+    === Private Attributes ===
+    _clock: the clock of the simulation this person is waiting in, or None
+            if this person is not currently waiting in a simulation
+    _wait_time: this person's wait time, while _clock is None
 
     === Representation invariants ===
     start >= 1
     target >= 1
     wait_time >= 0
     """
+    __slots__ = ('start', 'target', 'arrival_round', 'sprite',
+                 '_clock', '_wait_time')
     start: int
     target: int
-    wait_time: int
-    
+    arrival_round: Optional[int]
+    sprite: Optional[Any]
+    _clock: Optional[RoundClock]
+    _wait_time: int
+
     def __init__(self, start: int, target: int, wait_time: int) -> None:
         self.start = start
         self.target = target
-        self.wait_time = wait_time
-        PersonSprite.__init__(self)
-        
+        self.arrival_round = None
+        self.sprite = None
+        self._clock = None
+        self._wait_time = wait_time
+
+    @property
+    def wait_time(self) -> int:
+        """The number of rounds this person has been waiting."""
+        if self._clock is None:
+            return self._wait_time
+        return self._clock.round_num - self.arrival_round
+
+    @wait_time.setter
+    def wait_time(self, wait_time: int) -> None:
+        if self._clock is None:
+            self._wait_time = wait_time
+        else:
+            self.arrival_round = self._clock.round_num - wait_time
+
+    def start_waiting(self, clock: RoundClock) -> None:
+        """Start counting this person's wait time with the given clock.
+
+        The rounds this person had already waited are kept.
+        """
+        self.arrival_round = clock.round_num - self._wait_time
+        self._clock = clock
+
+    def stop_waiting(self) -> None:
+        """Stop this person's wait time at its current value."""
+        self._wait_time = self.wait_time
+        self._clock = None
+
     def get_anger_level(self) -> int:
-        if self.wait_time <= 2:
+        wait_time = self.wait_time
+        if wait_time <= 2:
             return 0
-        elif self.wait_time <= 4:
+        elif wait_time <= 4:
             return 1
-        elif self.wait_time <= 6:
+        elif wait_time <= 6:
             return 2
-        elif self.wait_time <= 8:
+        elif wait_time <= 8:
             return 3
         else:
             return 4
@@ -66,30 +133,207 @@ class Person(PersonSprite):
             - Level 4: waiting >= 9 rounds
         """
 
-class Elevator(ElevatorSprite):
+class WaitingQueue(Sequence):
+    """The people waiting for an elevator on one floor, in order of arrival.
+
+    People join at the back and board from the front, both in O(1) time per
+    person. Moving algorithms receive these queues as the values of the
+    simulation's waiting dictionary, and must treat them as read-only
+    sequences of people: they support len, iteration and indexing, like the
+    lists they replace.
+
+    === Private Attributes ===
+    _people: the waiting people, front of the queue first
+    """
+    __slots__ = ('_people',)
+    _people: Deque[Person]
+
+    def __init__(self, people: Iterable[Person] = ()) -> None:
+        self._people = deque(people)
+
+    def __len__(self) -> int:
+        return len(self._people)
+
+    def __iter__(self) -> Iterator[Person]:
+        return iter(self._people)
+
+    def __getitem__(self, index: int) -> Person:
+        return self._people[index]
+
+    def extend(self, people: Iterable[Person]) -> None:
+        """Add the given people to the back of this queue, in order."""
+        self._people.extend(people)
+
+    def board(self, count: int) -> List[Person]:
+        """Remove and return up to <count> people from the front of this
+        queue, in order.
+        """
+        people = self._people
+        return [people.popleft() for _ in range(min(count, len(people)))]
+
+
+class WaitingFloors(Mapping):
+    """The people waiting for an elevator in a building, by floor.
+
+    This is a read-only mapping from floor number to the WaitingQueue of that
+    floor, where only floors with someone waiting are keys, in the order in
+    which they last became occupied. It also keeps the occupied floors
+    sorted, so the lowest, highest and nearest occupied floors are found in
+    O(log F) time for a building with F floors.
+
+    === Private Attributes ===
+    _queues: the waiting queue of each occupied floor
+    _floors: the occupied floors, in increasing order
+    _since: for each occupied floor, the value of _occupied when it last
+            became occupied
+    _occupied: the number of times a floor has become occupied
+
+    === Representation invariants ===
+    No queue in _queues is empty.
+    _floors and _since have the same floors as _queues.
+    """
+    _queues: Dict[int, WaitingQueue]
+    _floors: List[int]
+    _since: Dict[int, int]
+    _occupied: int
+
+    def __init__(self, waiting: Optional[Mapping] = None) -> None:
+        """Initialize the waiting people of a building.
+
+        If given, <waiting> maps floors to the people waiting on them, in
+        the same shape as this mapping.
+        """
+        self._queues = {}
+        self._floors = []
+        self._since = {}
+        self._occupied = 0
+        if waiting is not None:
+            for floor, people in waiting.items():
+                self.add(floor, people)
+
+    def __getitem__(self, floor: int) -> WaitingQueue:
+        return self._queues[floor]
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._queues)
+
+    def __contains__(self, floor: object) -> bool:
+        return floor in self._queues
+
+    def add(self, floor: int, people: Iterable[Person]) -> None:
+        """Add the given people to the back of the queue on <floor>."""
+        queue = self._queues.get(floor)
+        if queue is not None:
+            queue.extend(people)
+            return
+        queue = WaitingQueue(people)
+        if len(queue) > 0:
+            self._queues[floor] = queue
+            bisect.insort(self._floors, floor)
+            self._since[floor] = self._occupied
+            self._occupied += 1
+
+    def board(self, floor: int, count: int) -> List[Person]:
+        """Remove and return up to <count> people from the front of the
+        queue on <floor>, in order.
+        """
+        queue = self._queues.get(floor)
+        if queue is None:
+            return []
+        people = queue.board(count)
+        if len(queue) == 0:
+            del self._queues[floor]
+            del self._since[floor]
+            del self._floors[bisect.bisect_left(self._floors, floor)]
+        return people
+
+    def lowest_floor(self) -> Optional[int]:
+        """Return the lowest floor where someone is waiting, or None."""
+        return self._floors[0] if self._floors else None
+
+    def highest_floor(self) -> Optional[int]:
+        """Return the highest floor where someone is waiting, or None."""
+        return self._floors[-1] if self._floors else None
+
+    def nearest_floor(self, floor: int) -> Optional[int]:
+        """Return the floor closest to <floor> where someone is waiting, or
+        None if nobody is waiting.
+
+        If a floor below and a floor above are equally close, return the one
+        where people have been waiting since earlier.
+        """
+        i = bisect.bisect_left(self._floors, floor)
+        below = self._floors[i - 1] if i > 0 else None
+        above = self._floors[i] if i < len(self._floors) else None
+        if below is None or above is None:
+            return above if below is None else below
+        if floor - below != above - floor:
+            return below if floor - below < above - floor else above
+        return below if self._since[below] < self._since[above] else above
+
+
+class Elevator:
     """An elevator in the elevator simulation.
 
     Remember to add additional documentation to this class docstring
     as you add new attributes (and representation invariants).
 
+    Passengers are also indexed by their target floor, so that everyone
+    getting off at a floor can be removed at once, and the nearest target
+    floor can be found without looking at every passenger.
+
     === Attributes ===
-    passengers: A list of the people currently on this elevator
+    passengers: A tuple of the people currently on this elevator, in the
+                order they boarded; it is read-only, so use boarding and
+                disembarking to change them
+    sprite: the sprite drawing this elevator, or None if this elevator
+            has not been visualized
+
+    === Private Attributes ===
+    _onboard: the people on this elevator, in boarding order, each mapped
+              to the number of people who boarded this elevator before them
+    _by_target: the people on this elevator, grouped by target floor; each
+                group is in boarding order
+    _targets: the keys of _by_target, in increasing order
+    _boarded: the number of people who have ever boarded this elevator
 
     === Representation invariants ===
+    passenNum == len(_onboard)
+    Every person in _onboard is in exactly one group of _by_target, and
+    no group of _by_target is empty.
     """
-    passengers: List[Person]
+    __slots__ = ('passenNum', 'capacity', 'maxFloor', 'curFloor', 'sprite',
+                 '_onboard', '_by_target', '_targets', '_boarded')
     passenNum: int
     capacity: int
     maxFloor: int
     curFloor: int
-    
+    sprite: Optional[Any]
+    _onboard: Dict[Person, int]
+    _by_target: Dict[int, List[Person]]
+    _targets: List[int]
+    _boarded: int
+
     def __init__(self, passengers: List[Person], maxFloor: int, capacity: int) -> None:
-        self.passengers = passengers
         self.curFloor = 1
         self.maxFloor = maxFloor
         self.capacity = capacity
         self.passenNum = 0
-        ElevatorSprite.__init__(self)
+        self.sprite = None
+        self._onboard = {}
+        self._by_target = {}
+        self._targets = []
+        self._boarded = 0
+        for person in passengers:
+            self.boarding(person)
+
+    @property
+    def passengers(self) -> Tuple[Person, ...]:
+        """The people currently on this elevator, in boarding order."""
+        return tuple(self._onboard)
 
     def fullness(self) -> float:
         return float(self.passenNum) / self.capacity
@@ -101,16 +345,71 @@ class Elevator(ElevatorSprite):
         self.curFloor -= 1
         
     def boarding(self, person: Person):
-        self.passengers.append(person)
+        self._onboard[person] = self._boarded
+        self._boarded += 1
+        group = self._by_target.get(person.target)
+        if group is None:
+            self._by_target[person.target] = [person]
+            bisect.insort(self._targets, person.target)
+        else:
+            group.append(person)
         self.passenNum += 1
         
     def disembarking(self, i):
-        self.passengers.pop(i)
+        person = self.passengers[i]
+        del self._onboard[person]
+        group = self._by_target[person.target]
+        group.remove(person)
+        if not group:
+            self._drop_target(person.target)
         self.passenNum -= 1
 
+    def disembark_at(self, floor: int) -> List[Person]:
+        """Remove and return every passenger whose target is <floor>, in the
+        order they boarded.
+        """
+        group = self._by_target.get(floor)
+        if group is None:
+            return []
+        for person in group:
+            del self._onboard[person]
+        self._drop_target(floor)
+        self.passenNum -= len(group)
+        return group
+
+    def first_passenger(self) -> Optional[Person]:
+        """Return the passenger who boarded this elevator first, or None if
+        this elevator is empty.
+        """
+        return next(iter(self._onboard), None)
+
+    def nearest_target(self, floor: int) -> Optional[int]:
+        """Return the passengers' target floor closest to <floor>, or None if
+        this elevator is empty.
+
+        If a target below and a target above are equally close, return the
+        one of the passenger who boarded first.
+        """
+        i = bisect.bisect_left(self._targets, floor)
+        below = self._targets[i - 1] if i > 0 else None
+        above = self._targets[i] if i < len(self._targets) else None
+        if below is None or above is None:
+            return above if below is None else below
+        if floor - below != above - floor:
+            return below if floor - below < above - floor else above
+        if (self._onboard[self._by_target[below][0]] <
+                self._onboard[self._by_target[above][0]]):
+            return below
+        return above
+
+    def _drop_target(self, floor: int) -> None:
+        """Remove the (emptied) group of passengers going to <floor>."""
+        del self._by_target[floor]
+        del self._targets[bisect.bisect_left(self._targets, floor)]
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['sprites'],
         'max-nested-blocks': 4
     })
@@ -0,0 +1,475 @@
+"""
+=== Module Description ===
+This file contains EventLogWriter, which records everything a simulation
+shows its visualizer into a compact, append-only binary event log, and
+EventLogReplay, which plays such a log back into a Visualizer afterwards.
+
+Pass an EventLogWriter as config['event_log'] to log a headless simulation:
+the writer takes the place of its visualizer. The log starts with a header
+(see HEADER), followed by one record per event, each starting with its
+type byte:
+
+    ROUND: a round begins (round number)
+    ARRIVALS: people arrive (their number, then an id, start and target
+              floor for each of them)
+    BOARD: a person boards an elevator (person id, elevator index)
+    DISEMBARK: a person leaves an elevator (person id, elevator index)
+    MOVES: the elevators move (one direction per elevator)
+    KEYFRAME: the full state at the start of the next round (the floor of
+              every elevator, then every passenger and waiting person)
+
+Keyframes are written every keyframe_interval rounds, so a replay can seek
+to any round by starting from the last keyframe before it. When the log is
+closed, a keyframe index follows the records: the number of keyframes, the
+round and position of each of them (see INDEX_ENTRY), and a trailer (see
+TRAILER) giving the position of the index. A replay maps the log into
+memory rather than reading it, and finds the keyframes from the index
+without reading the records; only a log that was never closed is scanned
+for them. For example,
+
+    python eventlog.py run.log --start 5000 --end 5100
+
+replays rounds 5000 to 5099 of the log run.log.
+"""
+import argparse
+import mmap
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from algorithms import Direction
+from entities import Elevator, Person, RoundClock, WaitingFloors
+from headless import HeadlessVisualizer
+
+# The magic bytes at the start of every event log
+MAGIC = b'ELEVLOG1'
+
+# The header: magic bytes, number of floors, number of elevators, elevator
+# capacity and keyframe interval
+HEADER = struct.Struct('<8siiii')
+
+# Record types
+ROUND = 0
+ARRIVALS = 1
+BOARD = 2
+DISEMBARK = 3
+MOVES = 4
+KEYFRAME = 5
+
+# The magic bytes at the end of a closed event log
+INDEX_MAGIC = b'ELEVIDX1'
+
+# An entry of the keyframe index: the round a keyframe is the state at the
+# start of, and its position in the log
+INDEX_ENTRY = struct.Struct('<qq')
+
+# The trailer: the position of the keyframe index, and magic bytes
+TRAILER = struct.Struct('<q8s')
+
+# Record layouts, after the type byte
+_ROUND = struct.Struct('<q')
+_COUNT = struct.Struct('<I')
+_PERSON = struct.Struct('<qii')
+_TRANSFER = struct.Struct('<qi')
+_KEYFRAME = struct.Struct('<II')
+_RIDER = struct.Struct('<qiiqi')
+_WAITER = struct.Struct('<qiiq')
+
+
+class EventLogWriter(HeadlessVisualizer):
+    """A visualizer that writes what it is shown to an event log.
+
+    === Attributes ===
+    path: the file the log is written to
+    keyframe_interval: the number of rounds between keyframes
+
+    === Private Attributes ===
+    _file: the open log file, or None before begin and after close
+    _elevators: the elevators of the simulation being logged
+    _indices: the index of every elevator in _elevators
+    _keyframes: the round and position of every keyframe written
+    _ids: the id of every person in the building
+    _waiting: the people waiting for an elevator, in order of arrival
+    _next_id: the id of the next person to arrive
+    _keyframe_due: whether a keyframe must be written at the start of the
+                   next round, whatever its number
+    """
+    path: str
+    keyframe_interval: int
+    _file: Optional[BinaryIO]
+    _elevators: List[Elevator]
+    _indices: Dict[Elevator, int]
+    _keyframes: List[Tuple[int, int]]
+    _ids: Dict[Person, int]
+    _waiting: Dict[Person, None]
+    _next_id: int
+    _keyframe_due: bool
+
+    def __init__(self, path: str, keyframe_interval: int = 1000) -> None:
+        """Initialize a writer of a new event log at <path>."""
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self._file = None
+        self._elevators = []
+        self._indices = {}
+        self._keyframes = []
+        self._ids = {}
+        self._waiting = {}
+        self._next_id = 0
+        self._keyframe_due = False
+
+    def __enter__(self) -> 'EventLogWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def begin(self, elevators: List[Elevator], num_floors: int) -> None:
+        """Start logging a simulation with the given elevators and number of
+        floors.
+        """
+        self._elevators = elevators
+        self._indices = {elevator: i for i, elevator in enumerate(elevators)}
+        self._keyframes = []
+        capacity = elevators[0].capacity if elevators else 0
+        self._file = open(self.path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, num_floors, len(elevators),
+                                     capacity, self.keyframe_interval))
+
+    def render_header(self, round_num: int) -> None:
+        if self._keyframe_due or round_num % self.keyframe_interval == 0:
+            self._keyframes.append((round_num, self._file.tell()))
+            self._write_keyframe()
+            self._keyframe_due = False
+        self._file.write(bytes([ROUND]) + _ROUND.pack(round_num))
+
+    def show_arrivals(self, arrivals: Dict[int, List[Person]]) -> None:
+        people = [person for group in arrivals.values() for person in group]
+        if not people:
+            return
+        data = [bytes([ARRIVALS]), _COUNT.pack(len(people))]
+        for person in people:
+            self._ids[person] = self._next_id
+            self._waiting[person] = None
+            data.append(_PERSON.pack(self._next_id, person.start,
+                                     person.target))
+            self._next_id += 1
+        self._file.write(b''.join(data))
+
+    def show_boarding(self, person: Person, elevator: Elevator) -> None:
+        del self._waiting[person]
+        self._file.write(bytes([BOARD]) + _TRANSFER.pack(
+            self._ids[person], self._indices[elevator]))
+
+    def show_disembarking(self, person: Person, elevator: Elevator) -> None:
+        self._file.write(bytes([DISEMBARK]) + _TRANSFER.pack(
+            self._ids.pop(person), self._indices[elevator]))
+
+    def show_state(self, elevators: List[Elevator],
+                   waiting: Dict[int, List[Person]]) -> None:
+        """Log the given elevators and waiting people as the state of the
+        simulation, in a keyframe at the start of the next round.
+        """
+        waiters = [person for people in waiting.values() for person in people]
+        ids = {}
+        for person in [person for elevator in elevators
+                       for person in elevator.passengers] + waiters:
+            if person in self._ids:
+                ids[person] = self._ids[person]
+            else:
+                ids[person] = self._next_id
+                self._next_id += 1
+        self._ids = ids
+        self._waiting = dict.fromkeys(waiters)
+        self._keyframe_due = True
+
+    def show_elevator_moves(self, elevators: List[Elevator],
+                            directions: List[Direction]) -> None:
+        self._file.write(bytes([MOVES]) + bytes(
+            direction.value & 0xFF for direction in directions))
+
+    def flush(self) -> None:
+        """Write out everything logged so far."""
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the log, after writing its keyframe index."""
+        if self._file is not None:
+            position = self._file.tell()
+            data = [_COUNT.pack(len(self._keyframes))]
+            data.extend(INDEX_ENTRY.pack(*keyframe)
+                        for keyframe in self._keyframes)
+            data.append(TRAILER.pack(position, INDEX_MAGIC))
+            self._file.write(b''.join(data))
+            self._file.close()
+            self._file = None
+
+    def _write_keyframe(self) -> None:
+        """Write the current state of the simulation as a keyframe."""
+        riders = [(self._ids[person], person.start, person.target,
+                   person.arrival_round, i)
+                  for i, elevator in enumerate(self._elevators)
+                  for person in elevator.passengers]
+        data = [bytes([KEYFRAME]), _KEYFRAME.pack(len(riders),
+                                                  len(self._waiting))]
+        data.append(struct.pack(f'<{len(self._elevators)}i',
+                                *(elevator.curFloor
+                                  for elevator in self._elevators)))
+        data.extend(_RIDER.pack(*rider) for rider in riders)
+        data.extend(_WAITER.pack(self._ids[person], person.start,
+                                 person.target, person.arrival_round)
+                    for person in self._waiting)
+        self._file.write(b''.join(data))
+
+
+class EventLogReplay:
+    """A replay of an event log into a visualizer.
+
+    The replay keeps its own headless elevators and people, which it updates
+    as it reads the log; create the visualizer with its elevators.
+
+    === Attributes ===
+    path: the file the log is read from
+    num_floors: the number of floors of the logged simulation
+    elevators: the elevators of the replay, in their state at the round
+               reached
+    keyframe_interval: the number of rounds between keyframes
+
+    === Private Attributes ===
+    _data: the contents of the log, mapped into memory
+    _end: the position in _data where the records end
+    _keyframes: the position of every keyframe in _data, by round
+    _clock: the round reached, which the replayed people wait with
+    _people: every replayed person in the building, by id
+    _waiting: the replayed people waiting for an elevator
+    """
+    path: str
+    num_floors: int
+    elevators: List[Elevator]
+    keyframe_interval: int
+    _data: Any
+    _end: int
+    _keyframes: Dict[int, int]
+    _clock: RoundClock
+    _people: Dict[int, Person]
+    _waiting: WaitingFloors
+
+    def __init__(self, path: str) -> None:
+        """Initialize a replay of the event log at <path>, reading its
+        keyframe index.
+
+        A log that was never closed has no index, and is scanned for its
+        keyframes instead.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            magic = file.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f'{path!r} is not an event log')
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, self.num_floors, num_elevators, capacity, \
+            self.keyframe_interval = HEADER.unpack_from(self._data)
+        self.elevators = [Elevator([], self.num_floors, capacity)
+                          for _ in range(num_elevators)]
+        self._clock = RoundClock()
+        self._people = {}
+        self._waiting = WaitingFloors()
+        self._end = len(self._data)
+        self._keyframes = {}
+        if not self._read_index():
+            round_num = -1
+            for offset, kind, values in self._records(HEADER.size):
+                if kind == ROUND:
+                    round_num = values
+                elif kind == KEYFRAME:
+                    self._keyframes[round_num + 1] = offset
+
+    def __enter__(self) -> 'EventLogReplay':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the log, after which it can no longer be played."""
+        self._data.close()
+
+    def play(self, visualizer: HeadlessVisualizer, start_round: int = 0,
+             end_round: Optional[int] = None) -> None:
+        """Show the rounds from <start_round> up to (but not including)
+        <end_round> with <visualizer>, or to the end of the log if
+        <end_round> is None.
+
+        The replay first restores the state at <start_round> from the last
+        keyframe before it, without showing the rounds in between.
+        """
+        keyframe = max((r for r in self._keyframes if r <= start_round),
+                       default=None)
+        offset = HEADER.size if keyframe is None else self._keyframes[keyframe]
+        shown = False
+        for _, kind, values in self._records(offset):
+            if kind == ROUND:
+                if end_round is not None and values >= end_round:
+                    return
+                self._clock.round_num = values
+                if values >= start_round and not shown:
+                    visualizer.show_state(self.elevators, self._waiting)
+                    shown = True
+            self._apply(kind, values, visualizer if shown else None)
+
+    def _apply(self, kind: int, values: Any,
+               visualizer: Optional[HeadlessVisualizer]) -> None:
+        """Update the replay with one record, and show it with <visualizer>
+        if it is not None.
+        """
+        if kind == KEYFRAME:
+            self._restore(*values)
+        elif kind == ROUND:
+            if visualizer is not None:
+                visualizer.render_header(values)
+        elif kind == ARRIVALS:
+            arrivals = {}
+            for person_id, start, target in values:
+                person = Person(start, target, 0)
+                person.start_waiting(self._clock)
+                self._people[person_id] = person
+                arrivals.setdefault(start, []).append(person)
+            for floor, people in arrivals.items():
+                self._waiting.add(floor, people)
+            if visualizer is not None:
+                visualizer.show_arrivals(arrivals)
+        elif kind == BOARD:
+            person, elevator = self._transfer(values)
+            self._waiting.board(person.start, 1)
+            elevator.boarding(person)
+            if visualizer is not None:
+                visualizer.show_boarding(person, elevator)
+        elif kind == DISEMBARK:
+            person, elevator = self._transfer(values)
+            del self._people[values[0]]
+            elevator.disembarking(elevator.passengers.index(person))
+            person.stop_waiting()
+            if visualizer is not None:
+                visualizer.show_disembarking(person, elevator)
+        else:
+            directions = [Direction(value) for value in values]
+            for elevator, direction in zip(self.elevators, directions):
+                elevator.curFloor += direction.value
+            if visualizer is not None:
+                visualizer.show_elevator_moves(self.elevators, directions)
+                visualizer.wait(1)
+            self._clock.round_num += 1
+
+    def _transfer(self, values: Tuple[int, int]) -> Tuple[Person, Elevator]:
+        """Return the person and elevator of a BOARD or DISEMBARK record."""
+        person_id, elevator = values
+        return self._people[person_id], self.elevators[elevator]
+
+    def _restore(self, floors: List[int], riders: List[Tuple],
+                 waiting: List[Tuple]) -> None:
+        """Replace the state of the replay with the given keyframe."""
+        self._people = {}
+        self._waiting = WaitingFloors()
+        for elevator, floor in zip(self.elevators, floors):
+            while elevator.passenNum > 0:
+                elevator.disembark_at(elevator.first_passenger().target)
+            elevator.curFloor = floor
+        for person_id, start, target, arrival_round, elevator in riders:
+            person = self._restore_person(person_id, start, target,
+                                          arrival_round)
+            self.elevators[elevator].boarding(person)
+        for person_id, start, target, arrival_round in waiting:
+            person = self._restore_person(person_id, start, target,
+                                          arrival_round)
+            self._waiting.add(start, [person])
+
+    def _restore_person(self, person_id: int, start: int, target: int,
+                        arrival_round: int) -> Person:
+        """Return a new person from a keyframe, waiting since
+        <arrival_round>.
+        """
+        person = Person(start, target, 0)
+        person.start_waiting(self._clock)
+        person.arrival_round = arrival_round
+        self._people[person_id] = person
+        return person
+
+    def _read_index(self) -> bool:
+        """Read the keyframe index of the log, and return whether it has
+        one.
+        """
+        data = self._data
+        if len(data) < HEADER.size + _COUNT.size + TRAILER.size:
+            return False
+        position, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        if magic != INDEX_MAGIC:
+            return False
+        count = _COUNT.unpack_from(data, position)[0]
+        start = position + _COUNT.size
+        for round_num, offset in INDEX_ENTRY.iter_unpack(
+                data[start:start + count * INDEX_ENTRY.size]):
+            self._keyframes[round_num] = offset
+        self._end = position
+        return True
+
+    def _records(self, offset: int) -> Iterator[Tuple[int, int, Any]]:
+        """Yield the position, type and values of every record from
+        <offset> on.
+        """
+        data = self._data
+        num_elevators = len(self.elevators)
+        while offset < self._end:
+            start = offset
+            kind = data[offset]
+            offset += 1
+            if kind == ROUND:
+                values = _ROUND.unpack_from(data, offset)[0]
+                offset += _ROUND.size
+            elif kind == ARRIVALS:
+                count = _COUNT.unpack_from(data, offset)[0]
+                offset += _COUNT.size
+                end = offset + count * _PERSON.size
+                values = list(_PERSON.iter_unpack(data[offset:end]))
+                offset = end
+            elif kind in (BOARD, DISEMBARK):
+                values = _TRANSFER.unpack_from(data, offset)
+                offset += _TRANSFER.size
+            elif kind == MOVES:
+                values = struct.unpack_from(f'<{num_elevators}b', data,
+                                            offset)
+                offset += num_elevators
+            elif kind == KEYFRAME:
+                num_riders, num_waiting = _KEYFRAME.unpack_from(data, offset)
+                offset += _KEYFRAME.size
+                floors = struct.unpack_from(f'<{num_elevators}i', data,
+                                            offset)
+                offset += 4 * num_elevators
+                end = offset + num_riders * _RIDER.size
+                riders = list(_RIDER.iter_unpack(data[offset:end]))
+                offset = end + num_waiting * _WAITER.size
+                waiting = list(_WAITER.iter_unpack(data[end:offset]))
+                values = (floors, riders, waiting)
+            else:
+                raise ValueError(f'unknown event type {kind} at {start}')
+            yield start, kind, values
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Replay an event log in the Pygame visualizer."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('log_file')
+    parser.add_argument('--start', type=int, default=0,
+                        help='first round to show (default: 0)')
+    parser.add_argument('--end', type=int, default=None,
+                        help='round to stop at (default: the end of the log)')
+    args = parser.parse_args(argv)
+
+    # Only import Pygame when something is actually drawn.
+    from visualizer import Visualizer
+    with EventLogReplay(args.log_file) as replay:
+        visualizer = Visualizer(replay.elevators, replay.num_floors, True)
+        replay.play(visualizer, args.start, args.end)
+
+
+if __name__ == '__main__':
+    main()
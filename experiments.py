@@ -0,0 +1,482 @@
+"""
+=== Module Description ===
+This file contains tools for running many headless simulations at once, such
+as parameter sweeps for capacity planning.
+
+Each simulation is described by a *spec*: a dictionary of plain, picklable
+values, which can be sent to worker processes. A spec has the keys of a
+simulation config, except that the algorithms are given by name:
+
+    num_floors, num_elevators, elevator_capacity, num_people_per_round:
+        as in a simulation config
+    moving_algorithm: the name of a MovingAlgorithm
+    arrival_generator: the name of an ArrivalGenerator (default
+        'RandomArrivals', which generates num_people_per_round people)
+    arrival_file: the trace read by 'FileArrivals' or
+        'traces:BinaryArrivals'
+    num_rounds: the number of rounds to run
+    seed: the seed for the random module, or None to leave it unseeded
+    engine: the simulation engine: 'object' (the default), 'numpy' or 'event'
+
+Names are looked up in the algorithms module; other classes can be given as
+'module:ClassName'.
+
+The module can also be run from the command line; see main.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import hashlib
+import importlib
+import itertools
+import math
+import os
+import random
+import statistics
+import sys
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple
+
+import algorithms
+from simulation import Simulation
+import traces
+
+# Spec values used when a spec leaves them out
+DEFAULT_SPEC = {
+    'num_floors': 6,
+    'num_elevators': 2,
+    'elevator_capacity': 3,
+    'num_people_per_round': 2,
+    'moving_algorithm': 'ShortSighted',
+    'arrival_generator': 'RandomArrivals',
+    'arrival_file': None,
+    'num_rounds': 100,
+    'seed': None,
+    'engine': 'object'
+}
+
+
+###############################################################################
+# Specs
+###############################################################################
+def find_class(name: str, base: type) -> type:
+    """Return the subclass of <base> with the given name.
+
+    <name> is either the name of a class in the algorithms module, or
+    'module:ClassName' for a class in any importable module.
+    """
+    if ':' in name:
+        module_name, class_name = name.split(':', 1)
+        module = importlib.import_module(module_name)
+    else:
+        module, class_name = algorithms, name
+    cls = getattr(module, class_name, None)
+    if not isinstance(cls, type) or not issubclass(cls, base):
+        raise ValueError(f'{name!r} is not a {base.__name__}')
+    return cls
+
+
+def make_generator(spec: Dict[str, Any]) -> algorithms.ArrivalGenerator:
+    """Return the arrival generator of the given spec."""
+    spec = {**DEFAULT_SPEC, **spec}
+    generator_class = find_class(spec['arrival_generator'],
+                                 algorithms.ArrivalGenerator)
+    if issubclass(generator_class, (algorithms.FileArrivals,
+                                    traces.BinaryArrivals)):
+        return generator_class(spec['num_floors'], spec['arrival_file'])
+    return generator_class(spec['num_floors'], spec['num_people_per_round'])
+
+
+def make_config(spec: Dict[str, Any],
+                arrivals: Optional[algorithms.ArrivalGenerator] = None
+                ) -> Dict[str, Any]:
+    """Return a headless simulation config built from the given spec.
+
+    If <arrivals> is given, it replaces the spec's arrival generator.
+    """
+    spec = {**DEFAULT_SPEC, **spec}
+    generator = make_generator(spec) if arrivals is None else arrivals
+    moving_class = find_class(spec['moving_algorithm'],
+                              algorithms.MovingAlgorithm)
+    return {
+        'num_floors': spec['num_floors'],
+        'num_elevators': spec['num_elevators'],
+        'elevator_capacity': spec['elevator_capacity'],
+        'num_people_per_round': spec['num_people_per_round'],
+        'arrival_generator': generator,
+        'moving_algorithm': moving_class(),
+        'visualize': False,
+        'engine': spec['engine']
+    }
+
+
+def run_spec(spec: Dict[str, Any],
+             arrivals: Optional[algorithms.ArrivalGenerator] = None
+             ) -> Dict[str, Any]:
+    """Run the simulation described by the given spec, with <arrivals> as
+    its arrival generator if it is given.
+
+    Return one table row: the spec's values, followed by the statistics of
+    the run.
+    """
+    spec = {**DEFAULT_SPEC, **spec}
+    if spec['seed'] is not None:
+        random.seed(spec['seed'])
+    stats = Simulation(make_config(spec, arrivals)).run(spec['num_rounds'])
+    return {**spec, **stats}
+
+
+###############################################################################
+# Sweeps
+###############################################################################
+def expand_grid(grid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return one spec for every combination of the values in <grid>.
+
+    Values of <grid> that are lists are swept over; all other values are
+    shared by every spec. Specs are in the order of itertools.product.
+    """
+    keys = list(grid)
+    choices = [grid[key] if isinstance(grid[key], list) else [grid[key]]
+               for key in keys]
+    return [dict(zip(keys, values)) for values in itertools.product(*choices)]
+
+
+def run_specs(specs: Iterable[Dict[str, Any]],
+              processes: Optional[int] = None,
+              arrivals: Optional[List[algorithms.ArrivalGenerator]] = None
+              ) -> List[Dict[str, Any]]:
+    """Run the simulations described by the given specs, across a pool of
+    <processes> worker processes (by default, one per core).
+
+    If <arrivals> is given, it holds the arrival generator of each spec.
+
+    Return the table rows of the runs, in the order of <specs>.
+    """
+    specs = list(specs)
+    if arrivals is None:
+        arrivals = [None] * len(specs)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(specs))
+    if processes <= 1:
+        return [run_spec(spec, generator)
+                for spec, generator in zip(specs, arrivals)]
+    chunksize = max(1, len(specs) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(run_spec, specs, arrivals, chunksize=chunksize))
+
+
+def run_sweep(grid: Dict[str, Any],
+              processes: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Run a simulation for every combination of the values in <grid> (see
+    expand_grid), in parallel, and return the table of their results.
+    """
+    return run_specs(expand_grid(grid), processes)
+
+
+###############################################################################
+# Replications
+###############################################################################
+# The degrees of freedom up to which t_quantile is exact
+_EXACT_DF = 30
+
+
+def replica_seed(seed: Optional[int], replica: int) -> int:
+    """Return the seed of replica number <replica> of a run seeded with
+    <seed>.
+
+    Seeds are derived by hashing, so they do not depend on how many replicas
+    are run, and any replica can be rerun alone. The replicas of an unseeded
+    run (<seed> is None) get seeds of their own, different from those of
+    every integer seed.
+    """
+    key = 'unseeded' if seed is None else str(seed)
+    digest = hashlib.sha256(f'{key}:{replica}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def replica_specs(spec: Dict[str, Any],
+                  num_replicas: int) -> List[Dict[str, Any]]:
+    """Return the specs of <num_replicas> independently seeded copies of
+    <spec>, each with its replica number under 'replica'.
+    """
+    return [{**spec, 'replica': i, 'seed': replica_seed(spec.get('seed'), i)}
+            for i in range(num_replicas)]
+
+
+def t_quantile(p: float, df: int) -> float:
+    """Return the <p> quantile of Student's t distribution with <df> degrees
+    of freedom.
+
+    Up to _EXACT_DF degrees of freedom, the exact distribution function (see
+    _t_cdf) is inverted by bisection; beyond that, the Cornish-Fisher
+    expansion around the normal quantile is used, which is within 0.001%
+    of the exact value for 0.001 <= p <= 0.999.
+    """
+    if p < 0.5:
+        return -t_quantile(1 - p, df)
+    if df <= _EXACT_DF:
+        low, high = 0.0, 1.0
+        while _t_cdf(high, df) < p:
+            low, high = high, 2 * high
+        for _ in range(60):
+            middle = (low + high) / 2
+            if _t_cdf(middle, df) < p:
+                low = middle
+            else:
+                high = middle
+        return (low + high) / 2
+    z = statistics.NormalDist().inv_cdf(p)
+    return (z
+            + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z)
+            / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3
+               - 945 * z) / (92160 * df ** 4))
+
+
+def _t_cdf(t: float, df: int) -> float:
+    """Return the probability that Student's t distribution with <df>
+    degrees of freedom is at most <t>.
+
+    This uses the finite series in cos(theta) ** 2, where
+    theta = atan(t / sqrt(df)), which is exact for integer <df>.
+    """
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    total, term = 0.0, 1.0
+    if df % 2 == 1:
+        for k in range((df - 1) // 2):
+            total += term
+            term *= cos2 * (2 * k + 2) / (2 * k + 3)
+        return 0.5 + (theta + math.sin(theta) * math.cos(theta) * total) \
+            / math.pi
+    for k in range(df // 2):
+        total += term
+        term *= cos2 * (2 * k + 1) / (2 * k + 2)
+    return 0.5 + math.sin(theta) * total / 2
+
+
+def summarize(samples: Dict[str, List[float]],
+              confidence: float = 0.95) -> List[Dict[str, Any]]:
+    """Return the mean, standard deviation and two-sided <confidence>
+    confidence interval of each list of samples in <samples>, one table row
+    per key.
+    """
+    rows = []
+    for name, values in samples.items():
+        n = len(values)
+        mean = statistics.fmean(values)
+        stdev = statistics.stdev(values) if n > 1 else 0.0
+        if n > 1:
+            half_width = (t_quantile((1 + confidence) / 2, n - 1) *
+                          stdev / math.sqrt(n))
+        else:
+            half_width = math.inf
+        rows.append({'statistic': name, 'n': n, 'mean': mean,
+                     'stdev': stdev, 'ci_low': mean - half_width,
+                     'ci_high': mean + half_width})
+    return rows
+
+
+def stat_samples(rows: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """Return the values of every numeric simulation statistic in the given
+    table rows, keyed by statistic.
+    """
+    names = [key for key, value in rows[0].items()
+             if key not in DEFAULT_SPEC and key != 'replica'
+             and isinstance(value, (int, float)) and
+             not isinstance(value, bool)]
+    return {name: [row[name] for row in rows] for name in names}
+
+
+def replicate(spec: Dict[str, Any], num_replicas: int,
+              processes: Optional[int] = None,
+              confidence: float = 0.95
+              ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Run <num_replicas> independently seeded copies of <spec> in parallel.
+
+    Return the table rows of the replicas, and a summary of every statistic
+    (see summarize).
+    """
+    rows = run_specs(replica_specs(spec, num_replicas), processes)
+    return rows, summarize(stat_samples(rows), confidence)
+
+
+def write_table(rows: List[Dict[str, Any]], file: TextIO) -> None:
+    """Write the given table rows to <file> as CSV."""
+    if not rows:
+        return
+    writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+###############################################################################
+# Paired comparisons
+###############################################################################
+def compare(spec: Dict[str, Any], moving_algorithms: List[str],
+            num_replicas: int = 10, processes: Optional[int] = None,
+            confidence: float = 0.95, baseline: Optional[str] = None
+            ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Compare the given moving algorithms with common random numbers.
+
+    For each of <num_replicas> independently seeded replicas of <spec>, one
+    arrival stream is generated and recorded in memory, and every algorithm
+    is run against that identical stream (and with the same seed, for
+    algorithms that use randomness themselves). Runs are spread over a pool
+    of <processes> worker processes.
+
+    Return the table rows of every run, and a summary (see summarize) of the
+    paired differences of every statistic between each algorithm and
+    <baseline> (by default, the first algorithm). Since both runs of a pair
+    see the same arrivals, the differences vary far less than the
+    statistics themselves.
+    """
+    if baseline is None:
+        baseline = moving_algorithms[0]
+    if baseline not in moving_algorithms:
+        moving_algorithms = [baseline] + list(moving_algorithms)
+    specs, arrivals = [], []
+    for replica in replica_specs({**DEFAULT_SPEC, **spec}, num_replicas):
+        random.seed(replica['seed'])
+        recorded = algorithms.record_arrivals(make_generator(replica),
+                                              replica['num_rounds'])
+        for name in moving_algorithms:
+            specs.append({**replica, 'moving_algorithm': name})
+            arrivals.append(recorded)
+    rows = run_specs(specs, processes, arrivals)
+
+    by_algorithm = {name: [row for row in rows
+                           if row['moving_algorithm'] == name]
+                    for name in moving_algorithms}
+    base_samples = stat_samples(by_algorithm[baseline])
+    summary = []
+    for name in moving_algorithms:
+        if name == baseline:
+            continue
+        samples = stat_samples(by_algorithm[name])
+        differences = {
+            statistic: [value - base for value, base in
+                        zip(values, base_samples[statistic])]
+            for statistic, values in samples.items()}
+        summary.extend({'moving_algorithm': name, 'baseline': baseline,
+                        **row}
+                       for row in summarize(differences, confidence))
+    return rows, summary
+
+
+###############################################################################
+# Command line
+###############################################################################
+def _add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add an option for every spec key to <parser>; each option takes one
+    or more values.
+    """
+    for key, default in DEFAULT_SPEC.items():
+        value_type = int if isinstance(default, int) or key == 'seed' else str
+        parser.add_argument('--' + key.replace('_', '-'), dest=key,
+                            type=value_type, nargs='+', default=[default])
+
+
+def _grid_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """Return the sweep grid given by the spec options of <args>."""
+    return {key: getattr(args, key) for key in DEFAULT_SPEC}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run experiments from the command line.
+
+    sweep: run every combination of the given spec values, e.g.
+        python experiments.py sweep --num-floors 20 40 --num-elevators 2 4 \\
+            --moving-algorithm PushyPassenger ShortSighted --num-rounds 500
+
+    replicate: run seeded replicas of every combination of the given spec
+    values, and summarize each statistic, e.g.
+        python experiments.py replicate --replicas 30 --seed 7 \\
+            --moving-algorithm RandomAlgorithm
+    Add --replica K to rerun replica K alone and print its results.
+
+    compare: run every given moving algorithm against the same recorded
+    arrivals in each replica, and summarize the paired differences of each
+    statistic from the baseline (by default, the first algorithm), e.g.
+        python experiments.py compare --replicas 20 --seed 7 \\
+            --moving-algorithm PushyPassenger ShortSighted
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sweep = commands.add_parser('sweep', help='run a parameter sweep')
+    _add_spec_arguments(sweep)
+    sweep.add_argument('--processes', type=int, default=None,
+                       help='number of worker processes (default: one per '
+                            'core)')
+    sweep.add_argument('--output', default=None,
+                       help='CSV file to write (default: standard output)')
+
+    replicate_parser = commands.add_parser(
+        'replicate', help='summarize independently seeded replicas')
+    _add_spec_arguments(replicate_parser)
+    replicate_parser.add_argument('--replicas', type=int, default=10,
+                                  help='number of replicas (default: 10)')
+    replicate_parser.add_argument('--replica', type=int, default=None,
+                                  help='rerun only this replica')
+    replicate_parser.add_argument('--confidence', type=float, default=0.95,
+                                  help='confidence level (default: 0.95)')
+    replicate_parser.add_argument('--processes', type=int, default=None)
+    replicate_parser.add_argument('--output', default=None)
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare moving algorithms on common arrivals')
+    _add_spec_arguments(compare_parser)
+    compare_parser.add_argument('--baseline', default=None,
+                                help='algorithm to compare against (default: '
+                                     'the first --moving-algorithm)')
+    compare_parser.add_argument('--replicas', type=int, default=10,
+                                help='number of replicas (default: 10)')
+    compare_parser.add_argument('--confidence', type=float, default=0.95,
+                                help='confidence level (default: 0.95)')
+    compare_parser.add_argument('--processes', type=int, default=None)
+    compare_parser.add_argument('--output', default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        grid = _grid_from_args(args)
+        moving_algorithms = grid.pop('moving_algorithm')
+        rows = []
+        for spec in expand_grid(grid):
+            _, summary = compare(spec, moving_algorithms, args.replicas,
+                                 args.processes, args.confidence,
+                                 args.baseline)
+            rows.extend({**spec, **row} for row in summary)
+        _write_output(rows, args.output)
+        return
+    specs = expand_grid(_grid_from_args(args))
+    if args.command == 'sweep':
+        rows = run_specs(specs, args.processes)
+    elif args.replica is not None:
+        rows = [run_spec({**spec, 'replica': args.replica,
+                          'seed': replica_seed(spec['seed'], args.replica)})
+                for spec in specs]
+    else:
+        rows = []
+        for spec in specs:
+            _, summary = replicate(spec, args.replicas, args.processes,
+                                   args.confidence)
+            rows.extend({**spec, **row} for row in summary)
+    _write_output(rows, args.output)
+
+
+def _write_output(rows: List[Dict[str, Any]], output: Optional[str]) -> None:
+    """Write the given table rows as CSV to the file named <output>, or to
+    standard output if <output> is None.
+    """
+    if output is None:
+        write_table(rows, sys.stdout)
+    else:
+        with open(output, 'w', newline='') as file:
+            write_table(rows, file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+=== Module Description ===
+This file contains the HeadlessVisualizer class, which stands in for the
+Pygame Visualizer when a simulation is not visualized.
+
+It has the same interface as visualizer.Visualizer, but every method does
+nothing. Unlike visualizer.py, this module never imports Pygame, so headless
+simulations neither load Pygame nor create any sprites.
+"""
+from typing import Any, Dict, List
+
+
+class HeadlessVisualizer:
+    """A visualizer that draws nothing.
+
+    visualizer.Visualizer extends this class, so a simulation can call the
+    same methods on its visualizer whether or not it is being drawn.
+    """
+    def render_header(self, round_num: int) -> None:
+        """Render text displaying the round number for this simulation."""
+
+    def show_arrivals(self, arrivals: Dict[int, List[Any]]) -> None:
+        """Show new arrivals."""
+
+    def show_boarding(self, person: Any, elevator: Any) -> None:
+        """Show boarding of the given person onto the given elevator."""
+
+    def show_disembarking(self, person: Any, elevator: Any) -> None:
+        """Show disembarking of the given person from the given elevator."""
+
+    def show_elevator_moves(self,
+                            elevators: List[Any],
+                            directions: List[Any]) -> None:
+        """Show elevator moves."""
+
+    def show_state(self, elevators: List[Any], waiting: Dict[int, Any]) -> None:
+        """Show the given elevators on their floors with their passengers,
+        and the given waiting people, when drawing starts part way through a
+        simulation.
+        """
+
+    def wait(self, wait_time: int) -> None:
+        """Wait for the specified amount of time, in seconds."""
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'max-nested-blocks': 4
+    })
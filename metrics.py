@@ -0,0 +1,112 @@
+"""
+=== Module Description ===
+This file contains WaitTimeHistogram, a bounded-memory streaming sketch of
+the wait times of the people who completed their rides in a simulation.
+
+The histogram is log-linear, in the style of an HDR histogram: small wait
+times are counted exactly, and larger ones in buckets whose width grows with
+the wait time, so that every bucket is narrow relative to the values in it.
+Its memory grows with the logarithm of the longest wait time, not with the
+number of people recorded.
+"""
+import math
+from typing import List, Tuple
+
+
+class WaitTimeHistogram:
+    """A streaming histogram of (non-negative, integer) wait times.
+
+    Wait times below 2 ** precision_bits are counted exactly. Larger wait
+    times share buckets with others that differ from them by less than
+    1 part in 2 ** (precision_bits - 1).
+
+    === Attributes ===
+    precision_bits: the number of significant bits kept of each wait time
+    total_count: the number of wait times recorded
+    max_value: the largest wait time recorded, or -1 if none were
+
+    === Private Attributes ===
+    _counts: the number of wait times recorded in each bucket
+
+    === Representation Invariants ===
+    precision_bits >= 1
+    total_count == sum(_counts)
+    """
+    precision_bits: int
+    total_count: int
+    max_value: int
+    _counts: List[int]
+
+    def __init__(self, precision_bits: int = 7) -> None:
+        """Initialize an empty histogram."""
+        self.precision_bits = precision_bits
+        self.total_count = 0
+        self.max_value = -1
+        self._counts = []
+
+    def record(self, value: int, count: int = 1) -> None:
+        """Record <count> occurrences of the wait time <value>.
+
+        Precondition: value >= 0 and count >= 0
+        """
+        index = self._bucket_index(value)
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += count
+        self.total_count += count
+        if count > 0 and value > self.max_value:
+            self.max_value = value
+
+    def percentile(self, percent: float) -> int:
+        """Return the wait time at the given percentile (nearest rank), or -1
+        if no wait times have been recorded.
+
+        The result is the largest wait time its bucket could hold, capped at
+        the largest wait time recorded, so it never understates the
+        percentile.
+
+        Precondition: 0 <= percent <= 100
+        """
+        if self.total_count == 0:
+            return -1
+        rank = max(1, math.ceil(percent / 100 * self.total_count))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._bucket_range(index)[1], self.max_value)
+        return self.max_value
+
+    def buckets(self) -> List[Tuple[int, int, int]]:
+        """Return the (lowest wait time, highest wait time, count) of every
+        non-empty bucket, in increasing order.
+        """
+        return [self._bucket_range(index) + (count,)
+                for index, count in enumerate(self._counts) if count > 0]
+
+    def _bucket_index(self, value: int) -> int:
+        """Return the index of the bucket holding <value>."""
+        size = 1 << self.precision_bits
+        if value < size:
+            return value
+        half = size >> 1
+        shift = value.bit_length() - self.precision_bits
+        return size + (shift - 1) * half + (value >> shift) - half
+
+    def _bucket_range(self, index: int) -> Tuple[int, int]:
+        """Return the lowest and highest wait time held by bucket <index>."""
+        size = 1 << self.precision_bits
+        if index < size:
+            return index, index
+        half = size >> 1
+        shift = (index - size) // half + 1
+        mantissa = (index - size) % half + half
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['math'],
+        'max-nested-blocks': 4
+    })
@@ -0,0 +1,162 @@
+"""
+=== Module Description ===
+This file contains RoundRecorder, which records per-round metrics of a
+simulation into columnar files on disk, and load_recording, which reads them
+back for offline analysis.
+
+Pass a RoundRecorder as config['recorder'] to record a simulation. At the
+end of every round, the recorder stores:
+
+    round: the round number
+    queue_length: the number of people waiting on each floor (one column
+                  per floor, floor 1 first)
+    load: the number of passengers on each elevator
+    position: the floor each elevator is on, after moving
+    direction: the direction each elevator moved in (1, 0 or -1)
+    arrivals: the number of people who arrived
+    completions: the number of people who reached their target floor
+
+Rows are buffered in preallocated NumPy arrays, and every chunk_rounds rounds
+the buffer is written out as one NPZ file (rounds-00000.npz, rounds-00001.npz,
+...), so memory use does not grow with the length of the run.
+"""
+import glob
+import os
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+# The per-round columns, and their types
+COLUMNS = {
+    'round': np.int64,
+    'queue_length': np.int32,
+    'load': np.int32,
+    'position': np.int32,
+    'direction': np.int8,
+    'arrivals': np.int32,
+    'completions': np.int32
+}
+
+
+class RoundRecorder:
+    """A recorder of per-round simulation metrics.
+
+    === Attributes ===
+    directory: the directory the chunk files are written to
+    chunk_rounds: the number of rounds written to each chunk file
+    num_chunks: the number of chunk files written so far
+
+    === Private Attributes ===
+    _buffers: the preallocated buffer of each column
+    _row: the number of rows currently in the buffers
+
+    === Representation Invariants ===
+    0 <= _row < chunk_rounds
+    """
+    directory: str
+    chunk_rounds: int
+    num_chunks: int
+    _buffers: Dict[str, np.ndarray]
+    _row: int
+
+    def __init__(self, directory: str, num_floors: int, num_elevators: int,
+                 chunk_rounds: int = 4096) -> None:
+        """Initialize a recorder for a building with the given number of
+        floors and elevators, writing into <directory>.
+
+        The directory is created if it does not exist.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_rounds = chunk_rounds
+        self.num_chunks = 0
+        widths = {'queue_length': num_floors, 'load': num_elevators,
+                  'position': num_elevators, 'direction': num_elevators}
+        self._buffers = {
+            name: np.zeros((chunk_rounds, widths[name]) if name in widths
+                           else chunk_rounds, dtype=dtype)
+            for name, dtype in COLUMNS.items()}
+        self._row = 0
+
+    def record(self, round_num: int, waiting: Dict[int, Any],
+               elevators: List[Any], directions: List[Any],
+               arrivals: int, completions: int) -> None:
+        """Record the end of the given round, from the simulation's waiting
+        queues, elevators and the directions they moved in.
+        """
+        row = self._row
+        buffers = self._buffers
+        queue_length = buffers['queue_length'][row]
+        queue_length[:] = 0
+        for floor, queue in waiting.items():
+            queue_length[floor - 1] = len(queue)
+        buffers['load'][row] = [elevator.passenNum for elevator in elevators]
+        buffers['position'][row] = [elevator.curFloor
+                                    for elevator in elevators]
+        buffers['direction'][row] = [direction.value
+                                     for direction in directions]
+        self._finish_row(round_num, arrivals, completions)
+
+    def record_arrays(self, round_num: int, queue_length: np.ndarray,
+                      load: np.ndarray, position: np.ndarray,
+                      direction: np.ndarray, arrivals: int,
+                      completions: int) -> None:
+        """Record the end of the given round from arrays holding the values
+        of its columns.
+        """
+        row = self._row
+        self._buffers['queue_length'][row] = queue_length
+        self._buffers['load'][row] = load
+        self._buffers['position'][row] = position
+        self._buffers['direction'][row] = direction
+        self._finish_row(round_num, arrivals, completions)
+
+    def flush(self) -> None:
+        """Write the buffered rounds to a new chunk file, if there are any.
+        """
+        if self._row == 0:
+            return
+        path = os.path.join(self.directory,
+                            f'rounds-{self.num_chunks:05d}.npz')
+        np.savez(path, **{name: buffer[:self._row]
+                          for name, buffer in self._buffers.items()})
+        self.num_chunks += 1
+        self._row = 0
+
+    def _finish_row(self, round_num: int, arrivals: int,
+                    completions: int) -> None:
+        """Fill in the scalar columns of the current row, and move on to the
+        next one, flushing the buffers if they are full.
+        """
+        row = self._row
+        self._buffers['round'][row] = round_num
+        self._buffers['arrivals'][row] = arrivals
+        self._buffers['completions'][row] = completions
+        self._row += 1
+        if self._row == self.chunk_rounds:
+            self.flush()
+
+
+def iter_chunks(directory: str) -> Iterator[Dict[str, np.ndarray]]:
+    """Yield the columns of each chunk file in <directory>, in order."""
+    for path in sorted(glob.glob(os.path.join(directory, 'rounds-*.npz'))):
+        with np.load(path) as chunk:
+            yield {name: chunk[name] for name in COLUMNS}
+
+
+def load_recording(directory: str) -> Dict[str, np.ndarray]:
+    """Return every column recorded in <directory>, across all its chunks.
+    """
+    chunks = list(iter_chunks(directory))
+    if not chunks:
+        raise FileNotFoundError(f'no recorded rounds in {directory!r}')
+    return {name: np.concatenate([chunk[name] for chunk in chunks])
+            for name in COLUMNS}
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['glob', 'os', 'numpy'],
+        'max-nested-blocks': 4
+    })
@@ -0,0 +1,278 @@
+"""
+=== Module Description ===
+This file contains BackgroundVisualizer, which lets a simulation run at full
+speed while it is drawn by a renderer in a separate thread or process.
+
+Instead of animating every event itself, a BackgroundVisualizer publishes an
+immutable RoundFrame of the state at the end of every round to a bounded
+queue. The renderer draws each frame it receives, sliding the elevators from
+the previous frame to it. When the simulation gets ahead of the renderer,
+the queue fills up and its oldest frames are dropped rather than waited for,
+so the last round is always drawn; when frames are queued the renderer
+stops sliding to catch up.
+
+Set config['renderer'] to 'thread' or 'process' (with config['visualize']
+set) to draw a simulation this way. A process is the default, since SDL can
+only draw from the main thread of a process on some platforms (macOS among
+them); a thread only suits renderers that do not use SDL.
+"""
+import multiprocessing
+import queue
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from algorithms import Direction
+from entities import Elevator, Person
+from headless import HeadlessVisualizer
+
+# The number of frames drawn to slide the elevators from one round to the
+# next, when the renderer is keeping up
+SLIDE_FRAMES = 10
+
+
+class RoundFrame(NamedTuple):
+    """The state of a simulation at the end of a round, as plain values.
+
+    === Attributes ===
+    round_num: the round that ended
+    floors: the floor of every elevator
+    fullness: the fraction of its capacity every elevator is filled
+    riders: the anger levels of the passengers of every elevator
+    waiting: the anger levels of the people waiting on each floor where
+             someone is waiting, as (floor, anger levels) pairs
+    """
+    round_num: int
+    floors: Tuple[int, ...]
+    fullness: Tuple[float, ...]
+    riders: Tuple[Tuple[int, ...], ...]
+    waiting: Tuple[Tuple[int, Tuple[int, ...]], ...]
+
+
+class BackgroundVisualizer(HeadlessVisualizer):
+    """A visualizer that publishes the state of every round to a renderer
+    running in the background.
+
+    Publishing a frame takes time linear in the number of people in the
+    building, since the frame is a full snapshot of the state: that is the
+    price of letting the renderer draw any frame without the ones dropped
+    before it.
+
+    === Attributes ===
+    frames_published: the number of frames handed to the renderer
+    frames_dropped: the number of published frames dropped, unseen, because
+                    the renderer was behind
+
+    === Private Attributes ===
+    _elevators: the elevators of the simulation being drawn
+    _waiting: the people waiting for an elevator, in order of arrival
+    _round_num: the current round
+    _mode: 'thread' or 'process', where the renderer runs
+    _target: the function run by the renderer
+    _args: the number of floors and elevators, passed to _target
+    _frames: the bounded queue of frames waiting to be drawn
+    _worker: the thread or process running the renderer, or None if it is
+             not running
+    """
+    frames_published: int
+    frames_dropped: int
+    _elevators: List[Elevator]
+    _waiting: Dict[Person, None]
+    _round_num: int
+    _mode: str
+    _target: Callable[..., None]
+    _args: Tuple[int, int]
+    _frames: Any
+    _worker: Optional[Any]
+
+    def __init__(self, elevators: List[Elevator], num_floors: int,
+                 mode: str = 'process', max_frames: int = 4,
+                 target: Optional[Callable[..., None]] = None) -> None:
+        """Initialize this visualizer, for a renderer of the given elevators
+        and number of floors in a background process (if <mode> is
+        'process') or thread (if <mode> is 'thread'). The renderer is
+        started when the first frame is published.
+
+        At most <max_frames> frames wait to be drawn at once. <target> is
+        the function run by the renderer, render_frames by default; it is
+        called with the frame queue, the number of floors and the number of
+        elevators, and must call task_done for every item it takes.
+        """
+        if target is None:
+            target = render_frames
+        self.frames_published = 0
+        self.frames_dropped = 0
+        self._elevators = elevators
+        self._waiting = {}
+        self._round_num = 0
+        self._mode = mode
+        self._target = target
+        self._args = (num_floors, len(elevators))
+        if mode == 'thread':
+            self._frames = queue.Queue(max_frames)
+        elif mode == 'process':
+            self._frames = multiprocessing.JoinableQueue(max_frames)
+        else:
+            raise ValueError(f'unknown renderer mode: {mode!r}')
+        self._worker = None
+
+    def render_header(self, round_num: int) -> None:
+        self._round_num = round_num
+
+    def show_arrivals(self, arrivals: Dict[int, List[Person]]) -> None:
+        for people in arrivals.values():
+            for person in people:
+                self._waiting[person] = None
+
+    def show_boarding(self, person: Person, elevator: Elevator) -> None:
+        del self._waiting[person]
+
+    def show_state(self, elevators: List[Elevator],
+                   waiting: Dict[int, List[Person]]) -> None:
+        self._elevators = elevators
+        self._waiting = {person: None for people in waiting.values()
+                         for person in people}
+
+    def show_elevator_moves(self, elevators: List[Elevator],
+                            directions: List[Direction]) -> None:
+        if self._worker is None:
+            self._start()
+        frame = self._frame()
+        while True:
+            try:
+                self._frames.put_nowait(frame)
+            except queue.Full:
+                # Make room by dropping the oldest frame, unless the
+                # renderer has just taken it.
+                try:
+                    self._frames.get_nowait()
+                except queue.Empty:
+                    continue
+                self._frames.task_done()
+                self.frames_dropped += 1
+            else:
+                self.frames_published += 1
+                return
+
+    def finish(self) -> None:
+        """Wait until the renderer has drawn or dropped every published
+        frame.
+        """
+        self._frames.join()
+
+    def close(self) -> None:
+        """Stop the renderer once it has drawn every published frame.
+
+        A renderer is started again if more frames are published.
+        """
+        if self._worker is not None:
+            self._frames.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def _start(self) -> None:
+        """Start the renderer in a background thread or process."""
+        args = (self._frames,) + self._args
+        if self._mode == 'thread':
+            self._worker = threading.Thread(target=self._target, args=args,
+                                            daemon=True)
+        else:
+            self._worker = multiprocessing.Process(target=self._target,
+                                                   args=args, daemon=True)
+        self._worker.start()
+
+    def _frame(self) -> RoundFrame:
+        """Return the current state of the simulation as a frame."""
+        waiting = {}
+        for person in self._waiting:
+            waiting.setdefault(person.start, []).append(
+                person.get_anger_level())
+        return RoundFrame(
+            self._round_num,
+            tuple(elevator.curFloor for elevator in self._elevators),
+            tuple(elevator.fullness() for elevator in self._elevators),
+            tuple(tuple(person.get_anger_level()
+                        for person in elevator.passengers)
+                  for elevator in self._elevators),
+            tuple((floor, tuple(levels))
+                  for floor, levels in sorted(waiting.items())))
+
+
+def render_frames(frames: Any, num_floors: int, num_elevators: int) -> None:
+    """Draw the frames taken from the queue <frames> in a Pygame window,
+    until None is taken.
+    """
+    # Pygame is only loaded by the renderer.
+    import pygame
+    import sprites
+    from visualizer import (FLOOR_BORDER_HEIGHT, FLOOR_HEIGHT,
+                            STAT_WINDOW_HEIGHT, WIDTH, FPS)
+
+    height = num_floors * FLOOR_HEIGHT + STAT_WINDOW_HEIGHT
+    screen = pygame.display.set_mode((WIDTH, height))
+    clock = pygame.time.Clock()
+    background = pygame.Surface((WIDTH, height))
+    background.fill(sprites.WHITE)
+    building = pygame.sprite.Group()
+    for floor in range(1, num_floors + 1):
+        y = height - (floor - 1) * FLOOR_HEIGHT - FLOOR_BORDER_HEIGHT
+        building.add(sprites.FloorSprite(WIDTH, FLOOR_HEIGHT, y),
+                     sprites.FloorNum(y - 20, str(floor)))
+    building.draw(background)
+    xs = [(i + 1) * WIDTH // (num_elevators + 1) for i in range(num_elevators)]
+
+    def floor_y(floor: float) -> float:
+        return height - (floor - 1) * FLOOR_HEIGHT - FLOOR_BORDER_HEIGHT
+
+    def person(level: int, centerx: float, bottom: float) -> None:
+        image = sprites.load_figure(level, sprites.PERSON_WIDTH,
+                                    sprites.PERSON_HEIGHT)
+        screen.blit(image, image.get_rect(centerx=centerx, bottom=bottom))
+
+    def draw(frame: RoundFrame, floors: List[float]) -> None:
+        pygame.event.pump()
+        screen.blit(background, (0, 0))
+        screen.blit(sprites.COMIC_SANS.render(f'Round {frame.round_num}',
+                                              True, sprites.BLACK), (5, 0))
+        for floor, levels in frame.waiting:
+            for i, level in enumerate(levels):
+                person(level, 10 + 4 * min(i, 10), floor_y(floor))
+        for x, floor, fullness, riders in zip(xs, floors, frame.fullness,
+                                              frame.riders):
+            rect = pygame.Rect(0, 0, sprites.ELEVATOR_WIDTH,
+                               sprites.ELEVATOR_HEIGHT)
+            rect.centerx, rect.bottom = x, floor_y(floor)
+            pygame.draw.rect(screen, sprites.GREEN, rect)
+            filled = rect.copy()
+            filled.height = round(rect.height * fullness)
+            filled.bottom = rect.bottom
+            pygame.draw.rect(screen, sprites.DARK_GREEN, filled)
+            for level in riders:
+                person(level, x, rect.bottom)
+        clock.tick(FPS)
+        pygame.display.flip()
+
+    previous = None
+    while True:
+        frame = frames.get()
+        if frame is None:
+            frames.task_done()
+            break
+        # Only slide the elevators when no frame is waiting to be drawn.
+        steps = SLIDE_FRAMES if previous is not None and frames.empty() else 1
+        for step in range(1, steps + 1):
+            draw(frame, [old + (new - old) * step / steps
+                         for old, new in zip(previous or frame.floors,
+                                             frame.floors)])
+        previous = frame.floors
+        frames.task_done()
+    pygame.display.quit()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['multiprocessing', 'queue', 'threading',
+                          'algorithms', 'entities', 'headless', 'pygame',
+                          'sprites', 'visualizer'],
+        'generated-members': 'pygame.*'
+    })
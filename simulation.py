@@ -11,12 +11,20 @@ remove any of the existing attributes.
 """
 # You may import more things from these modules (e.g., additional types from
 # typing), but you may not import from any other modules.
-from typing import Dict, List, Any
+import pickle
+import random
+from typing import Dict, List, Any, Optional, Tuple
+import zlib
 
 import algorithms
 from algorithms import Direction
-from entities import Person, Elevator
-from visualizer import Visualizer
+from entities import Person, Elevator, RoundClock, WaitingFloors
+from headless import HeadlessVisualizer
+from metrics import WaitTimeHistogram
+from timing import timed
+
+# The format version of the snapshots written by Simulation.snapshot
+SNAPSHOT_VERSION = 1
 
 
 class Simulation:
@@ -27,18 +35,78 @@ class Simulation:
     elevators: a list of the elevators in the simulation
     moving_algorithm: the algorithm used to decide how to move elevators
     num_floors: the number of floors
-    visualizer: the Pygame visualizer used to visualize this simulation
+    visualizer: the Pygame visualizer used to visualize this simulation, or
+                a HeadlessVisualizer that draws nothing if the simulation
+                is not visualized
     waiting: a dictionary of people waiting for an elevator
-             (keys are floor numbers, values are the list of waiting people)
+             (keys are floor numbers, values are the queue of waiting people;
+             only floors where someone is waiting are keys), which also
+             indexes the floors where people are waiting
+
+    === Private Attributes ===
+    _engine: the ArrayEngine that runs this simulation on NumPy arrays, or
+             None if the simulation runs on its elevators and waiting people
+    _clock: the current round, which every person in the simulation uses to
+            work out their wait time
+    _wait_times: a streaming histogram of the wait times of the people who
+                 reached their target floor
+    _percentiles: the wait time percentiles reported by _calculate_stats
+    _recorder: the RoundRecorder that records every round of this
+               simulation, or None
+    _directions: the directions the elevators moved in at the end of the
+                 last round
+    _recorded_totals: the total arrivals and completions at the end of the
+                      last recorded round
+    _timer: the StageTimer that times the stages of every round, or None
+    _event_driven: whether rounds in which nothing can happen are skipped
+    _event_log: the EventLogWriter that logs every event of this
+                simulation, or None
+    _background: the BackgroundVisualizer drawing this simulation in the
+                 background, or None
+
+    When config['engine'] is 'numpy', the rounds are run by an ArrayEngine
+    (see array_engine.py), and elevators and waiting are left untouched.
+
+    When config['engine'] is 'event', the simulation runs on its elevators
+    and waiting people, but jumps over rounds in which nobody arrives,
+    boards or leaves, when its moving algorithm has stable_directions. In
+    those rounds the elevators only keep moving as they did, so the
+    statistics are the same as running every round. Rounds are only skipped
+    when nothing watches them: the simulation must not be visualized,
+    recorded, timed or logged.
+
+    When config['event_log'] is an EventLogWriter (see eventlog.py), it
+    takes the place of the visualizer, so that the run can be replayed
+    later.
+
+    When config['renderer'] is 'thread' or 'process', a visualized
+    simulation runs at full speed, and is drawn by a renderer in a
+    background thread or process (see renderer.py).
+
+    When config['view_floors'] is set, a visualized simulation only shows
+    that many floors at a time, in a ViewportVisualizer, which shows more
+    than config['crowd_threshold'] (by default 8) people waiting on a floor
+    as a crowd.
     """
     arrival_generator: algorithms.ArrivalGenerator
     elevators: List[Elevator]
     moving_algorithm: algorithms.MovingAlgorithm
     num_floors: int
-    visualizer: Visualizer
-    waiting: Dict[int, List[Person]]
+    visualizer: HeadlessVisualizer
+    waiting: WaitingFloors
     
     statistics: Dict[str, int]
+    _engine: Optional[Any]
+    _clock: RoundClock
+    _wait_times: WaitTimeHistogram
+    _percentiles: List[float]
+    _recorder: Optional[Any]
+    _directions: List[Direction]
+    _recorded_totals: Tuple[int, int]
+    _timer: Optional[Any]
+    _event_driven: bool
+    _event_log: Optional[Any]
+    _background: Optional[Any]
 
     def __init__(self,
                  config: Dict[str, Any]) -> None:
@@ -54,21 +122,65 @@ class Simulation:
         self.statistics['min_time'] = float("inf")
         self.statistics['avg_time'] = 0
         self.statistics['total_time'] = 0
+        self._clock = RoundClock()
+        self._wait_times = WaitTimeHistogram()
+        self._percentiles = list(config.get('percentiles', [50, 95, 99]))
+        self._recorder = config.get('recorder')
+        self._directions = []
+        self._recorded_totals = (0, 0)
+        self._timer = config.get('timer')
+        self._event_log = config.get('event_log')
+        self._background = None
         self.arrival_generator = config['arrival_generator']
         self.num_floors = config['num_floors']
         self.moving_algorithm = config['moving_algorithm']
-        self.waiting = {}
-        for i in range(self.num_floors):
-            self.waiting[i] = []
+        self.waiting = WaitingFloors()
         self.elevators = []
         for i in range(config['num_elevators']):
             self.elevators.append(Elevator([], \
                                            config['num_floors'], config['elevator_capacity']))
         self.moving_algorithm = config['moving_algorithm']
-        self.waiting = {}
-        self.visualizer = Visualizer(self.elevators,  # should be self.elevators
-                                     self.num_floors,
-                                     config['visualize'])
+        engine = config.get('engine', 'object')
+        if self._event_log is not None:
+            if config['visualize'] or engine == 'numpy':
+                raise ValueError('an event log can only be written by a '
+                                 'headless object or event engine')
+            self._event_log.begin(self.elevators, self.num_floors)
+            self.visualizer = self._event_log
+        elif config['visualize'] and config.get('renderer') is not None:
+            from renderer import BackgroundVisualizer
+            self._background = BackgroundVisualizer(
+                self.elevators, self.num_floors, config['renderer'])
+            self.visualizer = self._background
+        elif config['visualize'] and config.get('view_floors') is not None:
+            from visualizer import ViewportVisualizer
+            self.visualizer = ViewportVisualizer(
+                self.elevators, self.num_floors, config['visualize'],
+                config['view_floors'], config.get('crowd_threshold', 8))
+        elif config['visualize']:
+            # Only import Pygame when something is actually drawn.
+            from visualizer import Visualizer
+            self.visualizer = Visualizer(self.elevators,
+                                         self.num_floors,
+                                         config['visualize'])
+        else:
+            self.visualizer = HeadlessVisualizer()
+
+        self._event_driven = (engine == 'event' and not config['visualize']
+                              and self._recorder is None
+                              and self._timer is None
+                              and self._event_log is None)
+        if engine == 'numpy':
+            if config['visualize']:
+                raise ValueError('the numpy engine cannot be visualized')
+            # NumPy is only needed by this engine.
+            from array_engine import ArrayEngine
+            self._engine = ArrayEngine(config, self.statistics,
+                                       self._wait_times, self._clock)
+        elif engine in ('object', 'event'):
+            self._engine = None
+        else:
+            raise ValueError(f'unknown simulation engine: {engine!r}')
         
         
     ############################################################################
@@ -82,104 +194,265 @@ class Simulation:
 
         Precondition: num_rounds >= 1.
 
-        Note: each run of the simulation starts from the same initial state
-        (no people, all elevators are empty and start at floor 1).
+        Note: a new simulation starts with no people, and all its elevators
+        empty and on floor 1. Running it again, or after restoring a
+        snapshot, continues from the round it stopped at.
+        """
+        self.statistics['num_iterations'] = self._clock.round_num + num_rounds
+        if self._engine is not None:
+            self._engine.run(num_rounds)
+        elif self._event_driven and self.moving_algorithm.stable_directions:
+            self._run_events(num_rounds)
+        else:
+            self._run_rounds(num_rounds)
+        if self._recorder is not None:
+            self._recorder.flush()
+        if self._event_log is not None:
+            self._event_log.flush()
+        if self._background is not None:
+            self._background.finish()
+            self._background.close()
+        if self._timer is not None:
+            self._timer.finish_run(num_rounds)
+        return self._calculate_stats()
+
+    def _run_rounds(self, num_rounds: int) -> None:
+        """Run the given number of rounds on the elevator and person objects,
+        timing each stage with this simulation's timer, if it has one.
         """
-        self.statistics['num_iterations'] = num_rounds
-        for i in range(num_rounds):
+        timer = self._timer
+        first = self._clock.round_num
+        for i in range(first, first + num_rounds):
             self.visualizer.render_header(i)
 
             # Stage 1: generate new arrivals
-            self._generate_arrivals(i)
+            with timed(timer, 'generate_arrivals'):
+                self._generate_arrivals(i)
 
             # Stage 2: leave elevators
-            self._handle_leaving()
+            with timed(timer, 'handle_leaving'):
+                self._handle_leaving()
 
             # Stage 3: board elevators
-            self._handle_boarding()
+            with timed(timer, 'handle_boarding'):
+                self._handle_boarding()
 
             # Stage 4: move the elevators using the moving algorithm
-            self._move_elevators()
+            with timed(timer, 'move_elevators'):
+                self._move_elevators()
+
+            if self._recorder is not None:
+                self._record_round(i)
 
             # Pause for 1 second
             self.visualizer.wait(1)
-        if self.statistics['people_completed'] == 0:
-            self.statistics['avg_time'] = -1
-            self.statistics['max_time'] = -1
-            self.statistics['min_time'] = -1
-        else:
-            self.statistics['avg_time'] = self.statistics['total_time'] // self.statistics['people_completed']
 
-        return self._calculate_stats()
+    def _run_events(self, num_rounds: int) -> None:
+        """Run the given number of rounds, skipping the rounds in which
+        nobody arrives, boards or leaves.
+
+        Only used for headless simulations whose moving algorithm has
+        stable_directions.
+        """
+        i = self._clock.round_num
+        end = i + num_rounds
+        while i < end:
+            self._generate_arrivals(i)
+            self._handle_leaving()
+            self._handle_boarding()
+            self._move_elevators()
+            i += 1
+            if i < end:
+                quiet = self._quiet_rounds(i, end - i)
+                if quiet > 0:
+                    for elevator, direction in zip(self.elevators,
+                                                   self._directions):
+                        elevator.curFloor += quiet * direction.value
+                    self._clock.round_num += quiet
+                    i += quiet
+
+    def _quiet_rounds(self, round_num: int, limit: int) -> int:
+        """Return how many rounds, starting at the given round and up to
+        <limit>, pass before someone can arrive, board or leave.
+        """
+        next_arrival = self.arrival_generator.next_arrival_round(round_num)
+        if next_arrival is not None:
+            limit = min(limit, next_arrival - round_num)
+        for elevator, direction in zip(self.elevators, self._directions):
+            step = direction.value
+            for steps in range(limit):
+                floor = elevator.curFloor + steps * step
+                if (floor < 1 or floor > self.num_floors
+                        or elevator.nearest_target(floor) == floor
+                        or (floor in self.waiting and
+                            elevator.passenNum < elevator.capacity)):
+                    limit = steps
+                    break
+                if step == 0:
+                    break
+        return limit
+
+    def _record_round(self, round_num: int) -> None:
+        """Record the end of the given round with this simulation's recorder.
+        """
+        arrivals = self.statistics['total_people']
+        completions = self.statistics['people_completed']
+        self._recorder.record(round_num, self.waiting, self.elevators,
+                              self._directions,
+                              arrivals - self._recorded_totals[0],
+                              completions - self._recorded_totals[1])
+        self._recorded_totals = (arrivals, completions)
 
     def _generate_arrivals(self, round_num: int) -> None:
         newPeople = self.arrival_generator.generate(round_num)
         for floor in newPeople:
             self.statistics['total_people'] += len(newPeople[floor])
         for floor, people in newPeople.items():
-            if floor in self.waiting.keys():
-                self.waiting[floor] = self.waiting[floor] + people
-            else:
-                self.waiting[floor] = people
+            for person in people:
+                person.start_waiting(self._clock)
+            self.waiting.add(floor, people)
         self.visualizer.show_arrivals(newPeople)
 
     def _handle_leaving(self) -> None:
         """Handle people leaving elevators."""
-        for i, elevator in enumerate(self.elevators):
-            for j, passenger in enumerate(elevator.passengers):
-                if passenger.target == elevator.curFloor:
-                    if passenger.wait_time > self.statistics['max_time']:
-                        self.statistics['max_time'] = passenger.wait_time
-                    if passenger.wait_time < self.statistics['min_time']:
-                        self.statistics['min_time'] = passenger.wait_time
-                    self.elevators[i].disembarking(j)
-                    self.visualizer.show_disembarking(passenger, self.elevators[i])
-                    self.statistics['total_time'] += passenger.wait_time
-                    self.statistics['people_completed'] += 1
-                    
+        for elevator in self.elevators:
+            for passenger in elevator.disembark_at(elevator.curFloor):
+                passenger.stop_waiting()
+                wait_time = passenger.wait_time
+                if wait_time > self.statistics['max_time']:
+                    self.statistics['max_time'] = wait_time
+                if wait_time < self.statistics['min_time']:
+                    self.statistics['min_time'] = wait_time
+                self.statistics['total_time'] += wait_time
+                self.statistics['people_completed'] += 1
+                self._wait_times.record(wait_time)
+                self.visualizer.show_disembarking(passenger, elevator)
 
     def _handle_boarding(self) -> None:
         """Handle boarding of people and visualize."""
-        for _, elevator in enumerate(self.elevators):
-            if elevator.curFloor in self.waiting.keys():
-                pop_list = []
-                for j, wait_person in enumerate(self.waiting[elevator.curFloor]):
-                    if elevator.passenNum < elevator.capacity:
-                        elevator.boarding(wait_person)
-                        pop_list.append(j)
-                        self.visualizer.show_boarding(wait_person, elevator)
-                cnt = 0
-                for j in pop_list:
-                    self.waiting[elevator.curFloor].pop(j - cnt)
-                    cnt += 1
-                if len(self.waiting[elevator.curFloor]) == 0:
-                    self.waiting.pop(elevator.curFloor)
-                    
-                    
-            
+        for elevator in self.elevators:
+            if elevator.curFloor not in self.waiting:
+                continue
+            for person in self.waiting.board(
+                    elevator.curFloor, elevator.capacity - elevator.passenNum):
+                elevator.boarding(person)
+                self.visualizer.show_boarding(person, elevator)
+
     def _move_elevators(self) -> None:
         """Move the elevators in this simulation.
 
         Use this simulation's moving algorithm to move the elevators.
         """
-        directions = self.moving_algorithm.move_elevators(self.elevators, self.waiting, self.num_floors)
+        with timed(self._timer, 'moving_algorithm'):
+            directions = self.moving_algorithm.move_elevators(self.elevators, self.waiting, self.num_floors)
         for i, direction in enumerate(directions):
             if direction == Direction.DOWN:
                 self.elevators[i].moveDown()
             elif direction == Direction.UP:
                 self.elevators[i].moveUp()
         self.visualizer.show_elevator_moves(self.elevators, directions)
-        for i, elevator in enumerate(self.elevators):
-            for j, _ in enumerate(elevator.passengers):
-                self.elevators[i].passengers[j].wait_time += 1
-        for floor in self.waiting:
-            for i in range(len(self.waiting[floor])):
-                self.waiting[floor][i].wait_time += 1
+        self._directions = directions
+        # Everyone still in the building waits one more round.
+        self._clock.round_num += 1
+
+    ############################################################################
+    # Snapshots
+    ############################################################################
+    def snapshot(self) -> bytes:
+        """Return a compact snapshot of the full state of this simulation.
+
+        The snapshot holds the waiting queues, the elevators' floors and
+        passengers, the statistics and wait time histogram, the current
+        round, the arrival generator (including how far it has got), the
+        moving algorithm and the state of the random module. People are
+        stored as (start, target, arrival round) triples, without sprites.
+
+        The visualizer, recorder and timer are not part of the snapshot.
+        """
+        if self._engine is not None:
+            raise ValueError('the numpy engine does not support snapshots')
+        state = {
+            'version': SNAPSHOT_VERSION,
+            'round_num': self._clock.round_num,
+            'statistics': dict(self.statistics),
+            'wait_times': self._wait_times,
+            'waiting': [(floor, [(person.start, person.target,
+                                  person.arrival_round) for person in queue])
+                        for floor, queue in self.waiting.items()],
+            'elevators': [(elevator.curFloor,
+                           [(person.start, person.target,
+                             person.arrival_round)
+                            for person in elevator.passengers])
+                          for elevator in self.elevators],
+            'directions': [direction.value for direction in self._directions],
+            'recorded_totals': self._recorded_totals,
+            'arrival_generator': self.arrival_generator,
+            'moving_algorithm': self.moving_algorithm,
+            'random_state': random.getstate()
+        }
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    def restore(self, data: bytes) -> None:
+        """Restore the state saved in the given snapshot into this simulation,
+        so that the next call to run continues from the snapshot's round.
+
+        This also restores the arrival generator, the moving algorithm and the
+        state of the random module. Assign a new moving_algorithm afterwards
+        to run a different algorithm from the same starting point.
+
+        The restored elevators and waiting people are shown to the
+        visualizer, which draws the rest of the run from there.
+
+        Precondition: this simulation has not been run.
+
+        Raise ValueError if this simulation does not have the number of
+        elevators of the simulation the snapshot was taken of.
+        """
+        if self._engine is not None:
+            raise ValueError('the numpy engine does not support snapshots')
+        state = pickle.loads(zlib.decompress(data))
+        if state['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version: "
+                             f"{state['version']!r}")
+        if len(state['elevators']) != len(self.elevators):
+            raise ValueError(f"the snapshot has {len(state['elevators'])} "
+                             f"elevators, not {len(self.elevators)}")
+        self._clock.round_num = state['round_num']
+        self.statistics.clear()
+        self.statistics.update(state['statistics'])
+        self._wait_times = state['wait_times']
+        for floor, people in state['waiting']:
+            self.waiting.add(floor, self._restore_people(people))
+        for elevator, (floor, people) in zip(self.elevators,
+                                             state['elevators']):
+            elevator.curFloor = floor
+            for person in self._restore_people(people):
+                elevator.boarding(person)
+        self._directions = [Direction(value)
+                            for value in state['directions']]
+        self._recorded_totals = state['recorded_totals']
+        self.arrival_generator = state['arrival_generator']
+        self.moving_algorithm = state['moving_algorithm']
+        random.setstate(state['random_state'])
+        self.visualizer.show_state(self.elevators, self.waiting)
+
+    def _restore_people(self, people: List[Tuple[int, int, int]]
+                        ) -> List[Person]:
+        """Return new people waiting with this simulation's clock, from
+        their (start, target, arrival round) triples.
+        """
+        restored = []
+        for start, target, arrival_round in people:
+            person = Person(start, target,
+                            self._clock.round_num - arrival_round)
+            person.start_waiting(self._clock)
+            restored.append(person)
+        return restored
 
     ############################################################################
     # Statistics calculations
     ############################################################################
-    def _calculate_stats(self) -> Dict[str, int]:
+    def _calculate_stats(self) -> Dict[str, Any]:
         """Report the statistics for the current run of this simulation.
         
         return {
@@ -189,8 +462,24 @@ class Simulation:
             'max_time': 0,
             'min_time': 0,
             'avg_time': 0
-        }"""
-        return self.statistics
+        }
+
+        Also report the wait time at each of the configured percentiles
+        (under keys such as 'p95_time'), and the histogram of wait times as
+        a list of (lowest, highest, count) buckets under 'wait_histogram'.
+        As with the other times, percentiles are -1 if nobody completed
+        their ride."""
+        stats = dict(self.statistics)
+        if stats['people_completed'] == 0:
+            stats['avg_time'] = -1
+            stats['max_time'] = -1
+            stats['min_time'] = -1
+        else:
+            stats['avg_time'] = stats['total_time'] // stats['people_completed']
+        for percent in self._percentiles:
+            stats[f'p{percent:g}_time'] = self._wait_times.percentile(percent)
+        stats['wait_histogram'] = self._wait_times.buckets()
+        return stats
 
 
 def sample_run() -> Dict[str, int]:
@@ -219,6 +508,8 @@ if __name__ == '__main__':
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['entities', 'visualizer', 'algorithms', 'time'],
+        'extra-imports': ['entities', 'visualizer', 'algorithms', 'time',
+                          'headless', 'array_engine', 'metrics', 'pickle',
+                          'random', 'zlib', 'timing', 'renderer'],
         'max-nested-blocks': 4
     })
\ No newline at end of file
@@ -4,21 +4,28 @@ This file contains the different Sprite classes, used for the visualization
 with Pygame, the graphics library we're using for this assignment.
 There's quite a bit in this file, but you aren't responsible for most of it.
 
-DO NOT CHANGE ANY CODE IN THIS FILE. You don't need to for this assignment,
-and in fact you aren't even submitting this file!
+This file is part of the visualization, not of the simulation: the
+simulation's entities are headless, and only the Visualizer creates sprites
+for them. Changes here should keep it that way.
 
 The two classes whose documentation you are required to read are ElevatorSprite
-and PersonSprite, as you'll be implementing their subclasses.
-You can completely ignore the other Sprite classes in this file.
+and PersonSprite. The simulation's entities do not inherit from them: the
+Visualizer wraps each entity it draws in a BoundElevatorSprite or
+BoundPersonSprite instead. You can completely ignore the other Sprite classes
+in this file.
 """
 import random
-from typing import Any
+from typing import Any, Dict, Tuple
 import pygame
 
 
 # Images for people
 FIGURES = [f'people/person{i}.png' for i in range(1, 6)]
 
+# Scaled images for people, shared by every PersonSprite in the process.
+# Keys are (anger level, width, height).
+_FIGURE_CACHE: Dict[Tuple[int, int, int], pygame.Surface] = {}
+
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -41,6 +48,12 @@ ELEVATOR_WIDTH = 44       # Elevator width
 PERSON_HEIGHT = 50        # Person height
 PERSON_WIDTH = 32         # Person width
 
+CROWD_WIDTH = 120         # Width of a crowd's bar when it is full
+CROWD_FULL = 100          # Number of people who fill a crowd's bar
+
+# The colour of a crowd's bar, for each anger level
+ANGER_COLOURS = [GREEN, YELLOW, (255, 165, 0), RED, (128, 0, 0)]
+
 # Fonts
 FONT_HEIGHT = 30
 pygame.init()
@@ -50,9 +63,28 @@ COMIC_SANS = pygame.font.SysFont('Comic Sans MS', FONT_HEIGHT)
 ###############################################################################
 # Sprites
 ###############################################################################
-class ElevatorSprite(pygame.sprite.Sprite):
+def load_figure(anger_level: int, width: int, height: int) -> pygame.Surface:
+    """Return the image for a person with the given anger level, scaled to
+    the given size.
+
+    Each image is loaded from disk and scaled only once; later calls return
+    the same (shared) surface, which must not be drawn on.
+    """
+    key = (anger_level, width, height)
+    image = _FIGURE_CACHE.get(key)
+    if image is None:
+        image = pygame.transform.scale(
+            pygame.image.load(FIGURES[anger_level]), (width, height))
+        _FIGURE_CACHE[key] = image
+    return image
+
+
+class ElevatorSprite(pygame.sprite.DirtySprite):
     """Sprite representing an elevator.
 
+    Like every moving sprite, it is drawn by a LayeredDirty group: it must
+    be marked dirty whenever it moves or its image changes.
+
     === Attributes ===
     image: the Pygame surface on which to draw this sprite
     rect: the rectangle representing the dimensions of this sprite
@@ -62,7 +94,7 @@ class ElevatorSprite(pygame.sprite.Sprite):
 
     def __init__(self) -> None:
         """Initialize a new ElevatorSprite."""
-        pygame.sprite.Sprite.__init__(self)
+        pygame.sprite.DirtySprite.__init__(self)
         self.image = pygame.Surface([ELEVATOR_WIDTH, ELEVATOR_HEIGHT])
         self.image.fill(GREEN)
         self.image.set_colorkey(WHITE)
@@ -75,6 +107,7 @@ class ElevatorSprite(pygame.sprite.Sprite):
         pygame.draw.rect(self.image, DARK_GREEN,
                          [0, ELEVATOR_HEIGHT * (1 - self.fullness()),
                           ELEVATOR_WIDTH, ELEVATOR_HEIGHT])
+        self.dirty = 1
 
     def fullness(self) -> float:
         """Return the fraction that this elevator is filled.
@@ -85,29 +118,35 @@ class ElevatorSprite(pygame.sprite.Sprite):
         raise NotImplementedError
 
 
-class PersonSprite(pygame.sprite.Sprite):
+class PersonSprite(pygame.sprite.DirtySprite):
     """Sprite representing a person.
 
+    It must be marked dirty whenever it moves or its image changes.
+
     === Attributes ===
     height: the height of the person sprite
     width: the width of the person sprite
     image: the Pygame surface on which to draw this sprite
     rect: the rectangle representing the dimensions of this sprite
+    anger_level: the anger level shown by the current image
 
     === Representation Invariants ===
     height >= 0
     width >= 0
+    0 <= anger_level <= 4
     """
     height: int
     width: int
     image: pygame.Surface
     rect: pygame.Rect
+    anger_level: int
 
     def __init__(self) -> None:
         """Initialize a new person sprite."""
         super().__init__()
         self.width, self.height = PERSON_WIDTH, PERSON_HEIGHT
-        self.image = self.load_image()
+        self.anger_level = self.get_anger_level()
+        self.image = load_figure(self.anger_level, self.width, self.height)
         self.rect = self.image.get_rect()
         self.rect.bottom = 0
         self.rect.centerx = random.randint(-2, 2)
@@ -116,8 +155,21 @@ class PersonSprite(pygame.sprite.Sprite):
         """Load the image for this sprite and redraws it
         Lower indices are happier :)
         """
-        image = pygame.image.load(FIGURES[self.get_anger_level()])
-        return pygame.transform.scale(image, (self.width, self.height))
+        return load_figure(self.get_anger_level(), self.width, self.height)
+
+    def refresh_image(self) -> bool:
+        """Swap this sprite's image if its anger level has changed since the
+        image was last set.
+
+        Return whether the image was swapped.
+        """
+        anger_level = self.get_anger_level()
+        if anger_level == self.anger_level:
+            return False
+        self.anger_level = anger_level
+        self.image = load_figure(anger_level, self.width, self.height)
+        self.dirty = 1
+        return True
 
     def get_anger_level(self) -> int:
         """Return the anger level of this sprite.
@@ -130,6 +182,91 @@ class PersonSprite(pygame.sprite.Sprite):
         raise  NotImplementedError
 
 
+class BoundElevatorSprite(ElevatorSprite):
+    """Sprite drawing one of the simulation's (headless) elevators.
+
+    === Attributes ===
+    elevator: the elevator entity this sprite draws
+    """
+    elevator: Any
+
+    def __init__(self, elevator: Any) -> None:
+        """Initialize a new sprite for the given elevator."""
+        self.elevator = elevator
+        ElevatorSprite.__init__(self)
+
+    def fullness(self) -> float:
+        """Return the fraction that the drawn elevator is filled."""
+        return self.elevator.fullness()
+
+
+class BoundPersonSprite(PersonSprite):
+    """Sprite drawing one of the simulation's (headless) people.
+
+    === Attributes ===
+    person: the person entity this sprite draws
+    """
+    person: Any
+
+    def __init__(self, person: Any) -> None:
+        """Initialize a new sprite for the given person."""
+        self.person = person
+        PersonSprite.__init__(self)
+
+    def get_anger_level(self) -> int:
+        """Return the anger level of the drawn person."""
+        return self.person.get_anger_level()
+
+
+class CrowdSprite(pygame.sprite.DirtySprite):
+    """Sprite showing a crowd waiting on a floor, instead of a PersonSprite
+    for each of them.
+
+    The crowd is drawn as a bar, which grows with the size of the crowd (up
+    to CROWD_FULL people), is coloured by the anger level of the person who
+    has waited longest, and is labelled with the size of the crowd.
+
+    === Attributes ===
+    image: the Pygame surface on which to draw this sprite
+    rect: the rectangle representing the dimensions of this sprite
+    size: the number of people in the crowd
+    anger_level: the anger level shown by the colour of the bar
+    """
+    image: pygame.Surface
+    rect: pygame.Rect
+    size: int
+    anger_level: int
+
+    def __init__(self, y: int) -> None:
+        """Initialize a new, empty crowd sprite standing on the floor at the
+        given y-coordinate.
+        """
+        super().__init__()
+        self.image = pygame.Surface([CROWD_WIDTH, PERSON_HEIGHT])
+        self.image.set_colorkey(WHITE)
+        self.rect = self.image.get_rect()
+        self.rect.bottom = y
+        self.rect.left = 5
+        self.size = 0
+        self.anger_level = 0
+
+    def show(self, size: int, anger_level: int) -> None:
+        """Show a crowd of the given size, whose longest wait gives the given
+        anger level.
+        """
+        if (size, anger_level) == (self.size, self.anger_level):
+            return
+        self.size, self.anger_level = size, anger_level
+        self.image.fill(WHITE)
+        bar_height = PERSON_HEIGHT // 2
+        pygame.draw.rect(self.image, ANGER_COLOURS[anger_level],
+                         [0, PERSON_HEIGHT - bar_height,
+                          CROWD_WIDTH * min(size, CROWD_FULL) // CROWD_FULL,
+                          bar_height])
+        self.image.blit(COMIC_SANS.render(str(size), True, BLACK), (0, 0))
+        self.dirty = 1
+
+
 class FloorSprite(pygame.sprite.Sprite):
     """Sprite that draws a floor of the building.
     """
@@ -155,7 +292,7 @@ class FloorNum(pygame.sprite.Sprite):
         self.rect.right = WIDTH - 20
 
 
-class StatLine(pygame.sprite.Sprite):
+class StatLine(pygame.sprite.DirtySprite):
     """Text Sprite for displaying some text.
     """
     def __init__(self, y: int, text: str):
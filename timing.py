@@ -0,0 +1,152 @@
+"""
+=== Module Description ===
+This file contains StageTimer, which measures where the time of a simulation
+goes, and the observers that export its measurements.
+
+Pass a StageTimer as config['timer'] to time a simulation. The timer
+accumulates the wall time and number of calls of each stage of a round:
+
+    generate_arrivals, handle_leaving, handle_boarding, move_elevators
+
+and, separately, of the moving algorithm's decision inside move_elevators:
+
+    moving_algorithm
+
+Timers accumulate across runs. At the end of every run, each of the timer's
+observers is notified, and can export the measurements; JSONReportObserver,
+for example, writes them to a JSON file.
+
+A simulation without a timer runs exactly as before: no clock is read and
+no observer is called.
+"""
+import contextlib
+import json
+import time
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+# The timed stages, in the order they run in a round
+STAGES = ['generate_arrivals', 'handle_leaving', 'handle_boarding',
+          'move_elevators', 'moving_algorithm']
+
+
+class TimingObserver:
+    """An observer of a StageTimer, notified at the end of every run.
+
+    This is an abstract class. Only its subclasses should be instantiated.
+    """
+
+    def run_finished(self, timer: 'StageTimer') -> None:
+        """Handle the end of a run timed by <timer>."""
+        raise NotImplementedError
+
+
+class StageTimer:
+    """A timer of the stages of simulation rounds.
+
+    === Attributes ===
+    seconds: the wall time spent in each stage
+    calls: the number of times each stage ran
+    num_rounds: the number of rounds timed
+    num_runs: the number of runs timed
+    observers: the observers notified at the end of every run
+
+    === Representation Invariants ===
+    seconds and calls have the same keys, which are all in STAGES.
+    """
+    seconds: Dict[str, float]
+    calls: Dict[str, int]
+    num_rounds: int
+    num_runs: int
+    observers: List[TimingObserver]
+
+    def __init__(self,
+                 observers: Optional[List[TimingObserver]] = None) -> None:
+        """Initialize a timer that has timed nothing yet."""
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self.calls = {stage: 0 for stage in STAGES}
+        self.num_rounds = 0
+        self.num_runs = 0
+        self.observers = list(observers or [])
+
+    @contextlib.contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Return a context manager that adds the wall time of its block to
+        <stage>.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+            self.calls[stage] += 1
+
+    def finish_run(self, num_rounds: int) -> None:
+        """Record the end of a run of <num_rounds> rounds, and notify the
+        observers.
+        """
+        self.num_rounds += num_rounds
+        self.num_runs += 1
+        for observer in self.observers:
+            observer.run_finished(self)
+
+    def report(self) -> Dict[str, Any]:
+        """Return the measurements of this timer as plain, JSON-serializable
+        values.
+        """
+        total = sum(self.seconds[stage] for stage in STAGES
+                    if stage != 'moving_algorithm')
+        stages = {}
+        for stage in STAGES:
+            seconds, calls = self.seconds[stage], self.calls[stage]
+            stages[stage] = {
+                'seconds': seconds,
+                'calls': calls,
+                'mean_seconds': seconds / calls if calls else 0.0,
+                'share': seconds / total if total else 0.0
+            }
+        return {'num_runs': self.num_runs, 'num_rounds': self.num_rounds,
+                'total_seconds': total, 'stages': stages}
+
+
+# The context manager timed returns without a timer; it is stateless, so one
+# instance serves every untimed stage.
+_UNTIMED = contextlib.nullcontext()
+
+
+def timed(timer: Optional[StageTimer], stage: str) -> ContextManager:
+    """Return a context manager that times its block as <stage> with
+    <timer>, or that does nothing if <timer> is None.
+
+    This lets a simulation engine run the same round loop whether or not it
+    is timed.
+    """
+    if timer is None:
+        return _UNTIMED
+    return timer.stage(stage)
+
+
+class JSONReportObserver(TimingObserver):
+    """An observer that writes the timer's report to a JSON file at the end
+    of every run, replacing the report of the previous run.
+
+    === Attributes ===
+    path: the file the report is written to
+    """
+    path: str
+
+    def __init__(self, path: str) -> None:
+        """Initialize an observer writing to <path>."""
+        self.path = path
+
+    def run_finished(self, timer: StageTimer) -> None:
+        """Write the report of <timer>."""
+        with open(self.path, 'w') as file:
+            json.dump(timer.report(), file, indent=2)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['contextlib', 'json', 'time'],
+        'max-nested-blocks': 4
+    })
@@ -0,0 +1,256 @@
+"""
+=== Module Description ===
+This file contains a compact binary format for arrival traces, which can be
+memory-mapped, so that the arrivals of any round are read without parsing.
+
+A trace file holds:
+
+    a header: the magic bytes b'ELEVTRC1', the maximum floor, the number of
+        records and the number of indexed rounds (see HEADER)
+    the records: one fixed-width (round, start, target) record per arriving
+        person, in round order (see RECORD)
+    the round index: for every round r from 0 to the last round with
+        arrivals, plus one, the position of the first record of round r, so
+        that round r is records[index[r]:index[r + 1]]
+
+Use TraceWriter to write a trace round by round (record_trace records any
+ArrivalGenerator into one), convert_csv to convert a CSV trace (in the
+format of sample_arrivals.csv), and BinaryArrivals to simulate one:
+
+    python traces.py convert sample_arrivals.csv sample_arrivals.trace 5
+"""
+import argparse
+import csv
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import algorithms
+from entities import Person
+
+# The magic bytes at the start of every trace file
+MAGIC = b'ELEVTRC1'
+
+# The header: magic bytes, maximum floor, number of records and number of
+# indexed rounds
+HEADER = struct.Struct('<8sqqq')
+
+# The fixed-width record of one arriving person
+RECORD = np.dtype([('round', '<i8'), ('start', '<i4'), ('target', '<i4')])
+
+# The type of the round index
+INDEX = np.dtype('<i8')
+
+
+class TraceWriter:
+    """A writer of binary arrival traces, which streams records to disk.
+
+    Rounds must be written in increasing order; writing the same round again
+    adds more arrivals to it. The round index is written by close.
+
+    === Attributes ===
+    path: the file the trace is written to
+    max_floor: the maximum floor of the building the trace is for
+    num_records: the number of records written so far
+
+    === Private Attributes ===
+    _file: the open trace file, or None once the trace is closed
+    _last_round: the last round written, or -1
+    """
+    path: str
+    max_floor: int
+    num_records: int
+    _file: Optional[BinaryIO]
+    _last_round: int
+
+    def __init__(self, path: str, max_floor: int) -> None:
+        """Initialize a writer of a new trace at <path>."""
+        self.path = path
+        self.max_floor = max_floor
+        self.num_records = 0
+        self._last_round = -1
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, max_floor, 0, 0))
+
+    def __enter__(self) -> 'TraceWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write_round(self, round_num: int, starts: Any, targets: Any) -> None:
+        """Write the arrivals of the given round, given their start and
+        target floors (as sequences of the same length).
+        """
+        if round_num < self._last_round:
+            raise ValueError(f'round {round_num} written after round '
+                             f'{self._last_round}')
+        records = np.empty(len(starts), dtype=RECORD)
+        records['round'] = round_num
+        records['start'] = starts
+        records['target'] = targets
+        self._file.write(records.tobytes())
+        self.num_records += len(records)
+        self._last_round = round_num
+
+    def close(self) -> None:
+        """Write the round index and the header, and close the file."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        records = _map_records(self.path, self.num_records)
+        num_rounds = self._last_round + 1
+        index = np.searchsorted(records['round'], np.arange(num_rounds + 1))
+        del records
+        with open(self.path, 'r+b') as file:
+            file.write(HEADER.pack(MAGIC, self.max_floor, self.num_records,
+                                   num_rounds))
+            file.seek(0, 2)
+            file.write(index.astype(INDEX).tobytes())
+
+
+def _map_records(path: str, num_records: int) -> np.ndarray:
+    """Return the <num_records> records of the trace at <path>, memory-mapped
+    read-only.
+    """
+    if num_records == 0:
+        # Empty maps are not allowed.
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.size,
+                     shape=(num_records,))
+
+
+def record_trace(generator: algorithms.ArrivalGenerator, num_rounds: int,
+                 path: str) -> None:
+    """Write the arrivals <generator> generates in rounds 0 to
+    num_rounds - 1 to a new trace at <path>.
+    """
+    with TraceWriter(path, generator.max_floor) as writer:
+        for round_num in range(num_rounds):
+            starts, targets = generator.generate_floors(round_num)
+            if len(starts) > 0:
+                writer.write_round(round_num, starts, targets)
+
+
+def convert_csv(csv_path: str, path: str, max_floor: int) -> None:
+    """Convert the CSV trace at <csv_path> into a new binary trace at <path>.
+
+    Precondition: the lines of the CSV trace are sorted by round number.
+    """
+    with open(csv_path, newline='') as file, \
+            TraceWriter(path, max_floor) as writer:
+        for line in csv.reader(file):
+            if line:
+                floors = [int(value) for value in line[1:]]
+                writer.write_round(int(line[0]), floors[0::2],
+                                   floors[1::2])
+
+
+class BinaryArrivals(algorithms.ArrivalGenerator):
+    """Generate arrivals from a memory-mapped binary trace.
+
+    The arrivals of a round are zero-copy slices of the mapped file, so any
+    round can be generated in any order, in time independent of the size of
+    the trace.
+
+    === Attributes ===
+    file_name: the name of the trace file this generator reads from
+
+    === Private Attributes ===
+    _rounds: the round of every record of the trace, memory-mapped
+    _starts: the start floor of every record of the trace, memory-mapped
+    _targets: the target floor of every record of the trace, memory-mapped
+    _index: the memory-mapped round index of the trace
+    """
+    file_name: str
+    _rounds: np.ndarray
+    _starts: np.ndarray
+    _targets: np.ndarray
+    _index: np.ndarray
+
+    def __init__(self, max_floor: int, filename: str) -> None:
+        """Initialize a new BinaryArrivals algorithm from the given trace.
+
+        The num_people attribute of every BinaryArrivals instance is set to
+        None, since the number of arrivals depends on the given trace.
+        """
+        algorithms.ArrivalGenerator.__init__(self, max_floor, None)
+        self.file_name = filename
+        self._open()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Return the state of this generator for pickling, without the
+        memory maps.
+        """
+        return {'max_floor': self.max_floor, 'num_people': self.num_people,
+                'file_name': self.file_name}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore a pickled generator, mapping its trace again."""
+        self.__dict__.update(state)
+        self._open()
+
+    def generate(self, round_num: int) -> Dict[int, List[Person]]:
+        starts, targets = self.generate_floors(round_num)
+        dic = {}
+        for start, target in zip(starts.tolist(), targets.tolist()):
+            dic.setdefault(start, []).append(Person(start, target, 0))
+        return dic
+
+    def generate_floors(self, round_num: int) -> Tuple[Any, Any]:
+        """Return the start and target floors of the new arrivals at the given
+        round, as two read-only NumPy arrays viewing the mapped trace.
+        """
+        if round_num >= len(self._index) - 1:
+            return self._starts[:0], self._targets[:0]
+        begin, end = self._index[round_num:round_num + 2].tolist()
+        return self._starts[begin:end], self._targets[begin:end]
+
+    def next_arrival_round(self, round_num: int) -> Optional[int]:
+        i = int(np.searchsorted(self._rounds, round_num))
+        if i == len(self._rounds):
+            return None
+        return int(self._rounds[i])
+
+    def _open(self) -> None:
+        """Map the trace file, checking its header."""
+        with open(self.file_name, 'rb') as file:
+            magic, max_floor, num_records, num_rounds = HEADER.unpack(
+                file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{self.file_name!r} is not an arrival trace')
+        if max_floor > self.max_floor:
+            raise ValueError(f'{self.file_name!r} has arrivals up to floor '
+                             f'{max_floor}')
+        # Plain array views of the maps are cheaper to slice.
+        records = np.asarray(_map_records(self.file_name, num_records))
+        self._rounds = records['round']
+        self._starts = records['start']
+        self._targets = records['target']
+        self._index = np.asarray(np.memmap(
+            self.file_name, dtype=INDEX, mode='r',
+            offset=HEADER.size + num_records * RECORD.itemsize,
+            shape=(num_rounds + 1,)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the trace tools from the command line.
+
+    convert: convert a CSV trace to a binary trace, e.g.
+        python traces.py convert sample_arrivals.csv sample_arrivals.trace 5
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert',
+                                  help='convert a CSV trace to binary')
+    convert.add_argument('csv_file')
+    convert.add_argument('trace_file')
+    convert.add_argument('max_floor', type=int)
+    args = parser.parse_args(argv)
+    convert_csv(args.csv_file, args.trace_file, args.max_floor)
+
+
+if __name__ == '__main__':
+    main()